@@ -0,0 +1,31 @@
+"""empty message
+
+Revision ID: 71f6ab08c2e4
+Revises: e5a09f3c7d12
+Create Date: 2026-10-18 14:21:09.553870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '71f6ab08c2e4'
+down_revision = 'e5a09f3c7d12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # indice trigram sobre tags.name (solo Postgres)
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('ix_tags_name_trgm', 'tags', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_tags_name_trgm', table_name='tags')
@@ -0,0 +1,34 @@
+"""empty message
+
+Revision ID: e5a09f3c7d12
+Revises: 8c41d2e7b5a3
+Create Date: 2026-10-18 13:05:40.226719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a09f3c7d12'
+down_revision = '8c41d2e7b5a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # indice GIN para la busqueda full-text (solo Postgres, en SQLite se usa FTS5)
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("""
+        CREATE INDEX ix_notes_search_document ON notes USING gin (
+            (setweight(to_tsvector('spanish'::regconfig, title), 'A') ||
+             setweight(to_tsvector('spanish'::regconfig, content), 'B'))
+        )
+    """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_notes_search_document")
@@ -8,3 +8,4 @@ npm run build
 pipenv install
 
 pipenv run upgrade
+pipenv run flask compress-static
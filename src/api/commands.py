@@ -1,6 +1,23 @@
 
 import click
-from api.models import db, User
+import datetime
+import json
+import sys
+import threading
+import time
+import uuid
+from sqlalchemy.orm import selectinload, joinedload
+from api.models import db, User, Notes, Comments, Votes, Tags, Notifications, RateLimitBuckets, note_tags
+from api.search import sync_search_index
+from api.images import profile_pictures_folder, remove_picture_files
+from api.storage import collect_garbage, DEFAULT_GC_GRACE
+from api.static_files import precompress, static_frontend
+from api.passwords import password_hasher
+from api.rate_limit import auth_rate_limiter
+from api.google_certs import make_stub_keys, make_stub_token
+
+# filas por lote en export-notes / import-notes
+NDJSON_BATCH_SIZE = 1000
 
 """
 In this file, you can add as many commands as you want using the @app.cli.command decorator
@@ -31,4 +48,386 @@ def setup_commands(app):
 
     @app.cli.command("insert-test-data")
     def insert_test_data():
-        pass
\ No newline at end of file
+        pass
+
+    """
+    Recalcula positive_votes / negative_votes de notas y comentarios desde la
+    tabla votes y corrige solo las filas que se desviaron: $ flask reconcile-vote-counts
+    """
+    @app.cli.command("reconcile-vote-counts")
+    def reconcile_vote_counts():
+        for model, id_column, vote_column in ((Notes, Notes.note_id, Votes.note_id),
+                                              (Comments, Comments.comment_id, Votes.comment_id)):
+            positive = db.select(db.func.count()).where(
+                vote_column == id_column, Votes.vote_type == 1).scalar_subquery()
+            negative = db.select(db.func.count()).where(
+                vote_column == id_column, Votes.vote_type == -1).scalar_subquery()
+            result = db.session.execute(
+                db.update(model).where(db.or_(
+                    model.positive_votes != positive,
+                    model.negative_votes != negative
+                )).values(positive_votes=positive, negative_votes=negative)
+                .execution_options(synchronize_session=False)
+            )
+            print(f"{model.__tablename__}: {result.rowcount} rows reconciled")
+        db.session.commit()
+
+    """
+    Recalcula User.unread_notifications desde la tabla notifications y corrige
+    solo los usuarios desviados: $ flask reconcile-notification-counts
+    """
+    @app.cli.command("reconcile-notification-counts")
+    def reconcile_notification_counts():
+        unread = db.select(db.func.count()).where(
+            Notifications.recipient_user_id == User.id,
+            Notifications.is_read.is_(False)).scalar_subquery()
+        result = db.session.execute(
+            db.update(User).where(User.unread_notifications != unread)
+            .values(unread_notifications=unread, updated_at=User.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        print(f"user: {result.rowcount} rows reconciled")
+        db.session.commit()
+
+    """
+    Borra las fotos de perfil que nadie usa (ref_count 0) con sus variantes, los
+    ficheros <sha256> sueltos y las subidas abandonadas; las fotos antiguas que
+    no estan en picture_blobs no se tocan. Solo toca lo que lleva mas de
+    --grace segundos asi, para no pisar fotos a mitad de procesado:
+    $ flask gc-pictures --grace 3600
+    """
+    @app.cli.command("gc-pictures")
+    @click.option("--grace", default=DEFAULT_GC_GRACE, show_default=True, type=int)
+    def gc_pictures(grace):
+        removed, orphans = collect_garbage(profile_pictures_folder(), grace, remove_picture_files)
+        print(f"picture_blobs: {removed} pictures removed, {orphans} stray files removed")
+
+    """
+    Genera los .br / .gz de los ficheros de texto de dist/ para que se sirvan
+    sin comprimir en cada peticion. Se corre despues de npm run build:
+    $ flask compress-static
+    """
+    @app.cli.command("compress-static")
+    def compress_static():
+        written = precompress(static_frontend.root)
+        print(f"dist: {written} precompressed files written")
+
+    """
+    Mide la latencia de POST /api/token (p50 / p99) con 1, 8 y 32 clientes a
+    la vez contra un usuario temporal que se borra al terminar. Las respuestas
+    503 (pool de bcrypt lleno) se cuentan aparte y no entran en la latencia:
+    $ flask benchmark-login --requests 64 --concurrency 1,8,32
+    """
+    @app.cli.command("benchmark-login")
+    @click.option("--requests", "total", default=64, show_default=True, type=int)
+    @click.option("--concurrency", default="1,8,32", show_default=True)
+    def benchmark_login(total, concurrency):
+        suffix = uuid.uuid4().hex[:8]
+        email, password = f"benchmark-{suffix}@example.com", f"benchmark-{suffix}"
+        user = User(email=email, username=f"benchmark-{suffix}", first_name="Benchmark",
+                    last_name="Login", is_active=True, password_hash=password_hasher.hash(password))
+        db.session.add(user)
+        db.session.commit()
+        # se mide bcrypt, no el rate limit (ver benchmark-rate-limit)
+        rate_limit_enabled = app.config['AUTH_RATE_LIMIT']
+        app.config['AUTH_RATE_LIMIT'] = False
+        try:
+            for clients in (int(value) for value in concurrency.split(',')):
+                latencies, rejected = [], []
+                pending = iter(range(total))
+                lock = threading.Lock()
+
+                def client():
+                    http = app.test_client()
+                    while True:
+                        with lock:
+                            if next(pending, None) is None:
+                                return
+                        started = time.perf_counter()
+                        status = http.post('/api/token', json={"email": email, "password": password}).status_code
+                        elapsed = time.perf_counter() - started
+                        with lock:
+                            (latencies if status == 200 else rejected).append(elapsed)
+
+                threads = [threading.Thread(target=client) for _ in range(clients)]
+                started = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                wall = time.perf_counter() - started
+
+                latencies.sort()
+                if latencies:
+                    p50 = latencies[len(latencies) // 2] * 1000
+                    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+                    print(f"{clients:>3} clients: p50 {p50:.0f} ms, p99 {p99:.0f} ms, "
+                          f"{len(latencies) / wall:.1f} logins/s, {len(rejected)} rejected")
+                else:
+                    print(f"{clients:>3} clients: {len(rejected)} rejected, no successful logins")
+        finally:
+            app.config['AUTH_RATE_LIMIT'] = rate_limit_enabled
+            db.session.delete(db.session.get(User, user.id))
+            db.session.commit()
+
+    """
+    Coste del rate limit de autenticacion: cada comprobacion de un cubo en
+    memoria y en la tabla compartida, y una peticion rechazada con 429 completa:
+    $ flask benchmark-rate-limit --calls 2000
+    """
+    @app.cli.command("benchmark-rate-limit")
+    @click.option("--calls", default=2000, show_default=True, type=int)
+    def benchmark_rate_limit(calls):
+        def report(label, timings):
+            timings.sort()
+            mean = sum(timings) / len(timings) * 1e6
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1e6
+            print(f"{label}: mean {mean:.0f} us, p99 {p99:.0f} us")
+
+        shared = app.config['AUTH_RATE_SHARED']
+        prefix = f"benchmark:{uuid.uuid4().hex[:8]}"
+        try:
+            with app.test_request_context():
+                for label, shared_mode in (("local bucket", False), ("shared bucket", True)):
+                    app.config['AUTH_RATE_SHARED'] = shared_mode
+                    timings = []
+                    for call in range(calls):
+                        started = time.perf_counter()
+                        auth_rate_limiter.consume(f"{prefix}:{call % 100}", 5, 60)
+                        timings.append(time.perf_counter() - started)
+                    report(label, timings)
+
+            app.config['AUTH_RATE_SHARED'] = False
+            http = app.test_client()
+            email = f"{prefix}@example.com"
+            timings = []
+            for _ in range(calls):
+                started = time.perf_counter()
+                response = http.post('/api/token', json={"email": email, "password": "x"})
+                if response.status_code == 429:
+                    timings.append(time.perf_counter() - started)
+            report(f"429 response ({len(timings)} of {calls})", timings)
+        finally:
+            app.config['AUTH_RATE_SHARED'] = shared
+            db.session.execute(db.delete(RateLimitBuckets).where(RateLimitBuckets.key.startswith(prefix)))
+            db.session.commit()
+
+    """
+    Servidor de claves de Google de prueba, para probar /api/google-login sin
+    red. Sirve los certificados en /certs (con Cache-Control max-age) y firma
+    ID tokens en /token?email=...; al arrancar imprime uno. La app tiene que
+    correr con GOOGLE_CERTS_URL=http://localhost:<port>/certs:
+    $ flask google-certs-stub --port 8765 --max-age 300
+    """
+    @app.cli.command("google-certs-stub")
+    @click.option("--port", default=8765, show_default=True, type=int)
+    @click.option("--max-age", default=300, show_default=True, type=int)
+    @click.option("--email", default="stub.user@example.com", show_default=True)
+    def google_certs_stub(port, max_age, email):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlparse, parse_qs
+
+        signer, certs = make_stub_keys()
+        audience = app.config['GOOGLE_CLIENT_ID']
+
+        class StubHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/certs':
+                    body = json.dumps(certs).encode()
+                    content_type = 'application/json'
+                elif url.path == '/token':
+                    token_email = parse_qs(url.query).get('email', [email])[0]
+                    body = make_stub_token(signer, audience, token_email).encode()
+                    content_type = 'text/plain'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Cache-Control', f'public, max-age={max_age}')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        print(f"GOOGLE_CERTS_URL=http://localhost:{port}/certs")
+        print(f"token for {email}: {make_stub_token(signer, audience, email)}")
+        ThreadingHTTPServer(('127.0.0.1', port), StubHandler).serve_forever()
+
+    """
+    Exporta todas las notas con sus tags, comentarios y votos como NDJSON (una
+    nota por linea) usando un cursor del lado del servidor, asi la memoria es
+    constante: $ flask export-notes notes.ndjson   (o "-" para stdout)
+    Los usuarios se referencian por email para poder importar en otra base; el
+    email viene en la misma query que cada lote, no en un diccionario con todos.
+    """
+    @app.cli.command("export-notes")
+    @click.argument("path", default="-")
+    def export_notes(path):
+        query = db.select(Notes).options(
+            joinedload(Notes.user).load_only(User.email),
+            selectinload(Notes.tags),
+            selectinload(Notes.votes).joinedload(Votes.user).load_only(User.email),
+            selectinload(Notes.comments).options(
+                joinedload(Comments.user).load_only(User.email),
+                selectinload(Comments.votes).joinedload(Votes.user).load_only(User.email)),
+        ).order_by(Notes.note_id).execution_options(
+            yield_per=NDJSON_BATCH_SIZE, stream_results=True)
+
+        def email_of(user):
+            return user.email if user is not None else None
+
+        def votes_of(votes):
+            return [{"user": email_of(vote.user), "vote_type": vote.vote_type} for vote in votes]
+
+        def isoformat(value):
+            return value.isoformat() if value else None
+
+        output = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+        started = time.monotonic()
+        exported = 0
+        try:
+            for note in db.session.scalars(query):
+                output.write(json.dumps({
+                    "note_id": note.note_id,
+                    "user": email_of(note.user),
+                    "title": note.title,
+                    "content": note.content,
+                    "is_anonymous": note.is_anonymous,
+                    "created_at": isoformat(note.created_at),
+                    "updated_at": isoformat(note.updated_at),
+                    "tags": [tag.name for tag in note.tags],
+                    "votes": votes_of(note.votes),
+                    "comments": [{
+                        "user": email_of(comment.user),
+                        "content": comment.content,
+                        "created_at": isoformat(comment.created_at),
+                        "updated_at": isoformat(comment.updated_at),
+                        "votes": votes_of(comment.votes),
+                    } for comment in note.comments],
+                }, ensure_ascii=False) + "\n")
+                exported += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        elapsed = time.monotonic() - started
+        print(f"{exported} notes exported in {elapsed:.1f}s "
+              f"({exported / elapsed if elapsed else exported:.0f} notes/s)", file=sys.stderr)
+
+    """
+    Importa un NDJSON generado por export-notes con inserts masivos por lotes
+    (un commit cada NDJSON_BATCH_SIZE notas): $ flask import-notes notes.ndjson
+    Los autores se buscan por email; las notas de usuarios inexistentes se
+    saltan y los tags que no existan se crean.
+    """
+    @app.cli.command("import-notes")
+    @click.argument("path", default="-")
+    def import_notes(path):
+        user_ids = {email: user_id for user_id, email in db.session.query(User.id, User.email).all()}
+        tag_ids = {name: tag_id for tag_id, name in db.session.query(Tags.tag_id, Tags.name).all()}
+        totals = {"notes": 0, "comments": 0, "votes": 0, "skipped": 0}
+
+        def parse_date(value):
+            return datetime.datetime.fromisoformat(value) if value else datetime.datetime.utcnow()
+
+        def count_votes(votes):
+            positive = sum(1 for vote in votes if vote["vote_type"] == 1)
+            negative = sum(1 for vote in votes if vote["vote_type"] == -1)
+            return positive, negative
+
+        def vote_rows(votes, **target):
+            return [dict(target, user_id=user_ids[vote["user"]], vote_type=vote["vote_type"])
+                    for vote in votes if vote["user"] in user_ids]
+
+        def insert_returning_ids(model, id_column, rows):
+            if not rows:
+                return []
+            return db.session.scalars(
+                db.insert(model).returning(id_column, sort_by_parameter_order=True), rows).all()
+
+        def flush_batch(records):
+            new_tags = {name for record in records for name in record["tags"] if name not in tag_ids}
+            if new_tags:
+                created = db.session.execute(
+                    db.insert(Tags).returning(Tags.tag_id, Tags.name, sort_by_parameter_order=True),
+                    [{"name": name} for name in sorted(new_tags)]).all()
+                tag_ids.update({name: tag_id for tag_id, name in created})
+
+            note_rows = []
+            for record in records:
+                positive, negative = count_votes(vote_rows(record["votes"], note_id=None))
+                note_rows.append({
+                    "user_id": user_ids[record["user"]],
+                    "title": record["title"],
+                    "content": record["content"],
+                    "is_anonymous": record["is_anonymous"],
+                    "created_at": parse_date(record["created_at"]),
+                    "updated_at": parse_date(record["updated_at"]),
+                    "positive_votes": positive,
+                    "negative_votes": negative,
+                })
+            note_ids = insert_returning_ids(Notes, Notes.note_id, note_rows)
+
+            comment_rows, comment_votes, association_rows, votes = [], [], [], []
+            for note_id, record in zip(note_ids, records):
+                association_rows.extend({"note_id": note_id, "tag_id": tag_ids[name]}
+                                        for name in dict.fromkeys(record["tags"]))
+                votes.extend(vote_rows(record["votes"], note_id=note_id))
+                for comment in record["comments"]:
+                    if comment["user"] not in user_ids:
+                        continue
+                    positive, negative = count_votes(vote_rows(comment["votes"], comment_id=None))
+                    comment_rows.append({
+                        "note_id": note_id,
+                        "user_id": user_ids[comment["user"]],
+                        "content": comment["content"],
+                        "created_at": parse_date(comment["created_at"]),
+                        "updated_at": parse_date(comment["updated_at"]),
+                        "positive_votes": positive,
+                        "negative_votes": negative,
+                    })
+                    comment_votes.append(comment["votes"])
+
+            comment_ids = insert_returning_ids(Comments, Comments.comment_id, comment_rows)
+            for comment_id, comment_vote_list in zip(comment_ids, comment_votes):
+                votes.extend(vote_rows(comment_vote_list, comment_id=comment_id))
+
+            if association_rows:
+                db.session.execute(note_tags.insert(), association_rows)
+            if votes:
+                db.session.execute(db.insert(Votes), votes)
+            db.session.commit()
+
+            totals["notes"] += len(note_ids)
+            totals["comments"] += len(comment_ids)
+            totals["votes"] += len(votes)
+
+        source = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        started = time.monotonic()
+        batch = []
+        try:
+            for line in source:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("user") not in user_ids:
+                    totals["skipped"] += 1
+                    continue
+                batch.append(record)
+                if len(batch) >= NDJSON_BATCH_SIZE:
+                    flush_batch(batch)
+                    batch = []
+            if batch:
+                flush_batch(batch)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        sync_search_index(db.session.connection())
+        db.session.commit()
+
+        elapsed = time.monotonic() - started
+        print(f"{totals['notes']} notes, {totals['comments']} comments and {totals['votes']} votes "
+              f"imported in {elapsed:.1f}s ({totals['notes'] / elapsed if elapsed else totals['notes']:.0f} notes/s), "
+              f"{totals['skipped']} notes skipped (unknown author)")
@@ -0,0 +1,175 @@
+"""
+Compresion negociada (br / gzip) de las respuestas JSON de la API.
+
+- Solo se comprimen respuestas JSON / NDJSON a partir de COMPRESS_MIN_SIZE bytes;
+  las respuestas en streaming se comprimen chunk a chunk.
+- Las respuestas con ETag (tags, notas, comentarios, perfil...) guardan su cuerpo
+  comprimido en una LRU acotada por bytes. Si llega otra peticion con el mismo
+  ETag, conditional_response() la sirve desde aqui sin volver a construir ni
+  comprimir el cuerpo.
+- Cada codificacion tiene su propio ETag ("<etag>-gzip", "<etag>-br"): dos
+  cuerpos distintos no pueden compartir un ETag fuerte. conditional_response()
+  acepta cualquiera de ellos en If-None-Match.
+
+Configuracion (variables de entorno o app.config):
+COMPRESS_MIN_SIZE, COMPRESS_LEVEL (gzip 1-9), COMPRESS_BR_LEVEL (brotli 0-11),
+COMPRESS_CACHE_MAX_BYTES.
+"""
+import gzip
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from flask import request, current_app, Response
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional, sin el paquete solo ofrecemos gzip
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson'}
+ENCODINGS = ('br', 'gzip')
+
+
+class CompressedBodyCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry, max_bytes):
+        body_size = len(entry[0])
+        if body_size > max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[key] = entry
+            self._size += body_size
+            while self._size > max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[0])
+
+
+compressed_cache = CompressedBodyCache()
+
+
+def negotiate_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def encoded_etag(etag, encoding):
+    return f"{etag}-{encoding}"
+
+
+def etag_variants(etag):
+    # el ETag sin comprimir y el de cada codificacion que podemos servir
+    return [etag] + [encoded_etag(etag, encoding) for encoding in ENCODINGS]
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['COMPRESS_BR_LEVEL'])
+    return gzip.compress(data, compresslevel=current_app.config['COMPRESS_LEVEL'], mtime=0)
+
+
+def _compress_stream(chunks, encoding, level, br_level):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=br_level)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        # wbits 31 = formato gzip
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def _cache_key(etag, encoding):
+    # el Accept distingue JSON de NDJSON en las listas, que comparten ETag
+    return (request.full_path, request.headers.get('Accept'), etag, encoding)
+
+
+def cached_response(etag):
+    """
+    Respuesta ya comprimida para este ETag y la codificacion que acepta el
+    cliente, o None si no la tenemos.
+    """
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return None
+    entry = compressed_cache.get(_cache_key(etag, encoding))
+    if entry is None:
+        return None
+    body, mimetype = entry
+    response = Response(body, mimetype=mimetype)
+    response.headers['Content-Encoding'] = encoding
+    response.set_etag(encoded_etag(etag, encoding))
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def compress_response(response):
+    if response.status_code != 200 or response.direct_passthrough:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    if 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    config = current_app.config
+    etag, weak = response.get_etag()
+    if response.is_streamed:
+        response.response = _compress_stream(
+            response.iter_encoded(), encoding, config['COMPRESS_LEVEL'], config['COMPRESS_BR_LEVEL'])
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(encoded_etag(etag, encoding), weak)
+        return response
+
+    data = response.get_data()
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    body = _compress(data, encoding)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+
+    if etag:
+        response.set_etag(encoded_etag(etag, encoding), weak)
+        if not weak:
+            compressed_cache.put(_cache_key(etag, encoding), (body, response.mimetype),
+                                 config['COMPRESS_CACHE_MAX_BYTES'])
+    return response
+
+
+def setup_compression(app):
+    app.config.setdefault('COMPRESS_MIN_SIZE', int(os.getenv('COMPRESS_MIN_SIZE', 1024)))
+    app.config.setdefault('COMPRESS_LEVEL', int(os.getenv('COMPRESS_LEVEL', 6)))
+    app.config.setdefault('COMPRESS_BR_LEVEL', int(os.getenv('COMPRESS_BR_LEVEL', 5)))
+    app.config.setdefault('COMPRESS_CACHE_MAX_BYTES', int(
+        os.getenv('COMPRESS_CACHE_MAX_BYTES', 8 * 1024 * 1024)))
+
+    app.after_request(compress_response)
@@ -0,0 +1,233 @@
+"""
+Claves de Google para verificar los ID token de /api/google-login sin pedirlas
+en cada login.
+
+- Los certificados se guardan hasta que caduca el max-age del Cache-Control de
+  Google (menos el Age). La cache esta en memoria y en un fichero compartido por
+  todos los workers de la maquina; solo uno descarga (flock), los demas leen el
+  fichero.
+- Un hilo los renueva GOOGLE_CERTS_REFRESH_MARGIN segundos antes de caducar, asi
+  ningun login espera por la red.
+- Si Google no responde se siguen usando los ultimos durante
+  GOOGLE_CERTS_STALE_GRACE segundos.
+- Un token con un kid que no conocemos (Google acaba de rotar) fuerza una
+  descarga, como mucho una cada FORCED_REFRESH_INTERVAL segundos.
+
+Para probar sin red: flask google-certs-stub levanta un servidor de claves local
+y genera ID tokens firmados; basta con GOOGLE_CERTS_URL apuntando a el.
+
+Configuracion (variables de entorno o app.config):
+GOOGLE_CLIENT_ID, GOOGLE_CERTS_URL, GOOGLE_CERTS_CACHE_FILE,
+GOOGLE_CERTS_REFRESH_MARGIN, GOOGLE_CERTS_STALE_GRACE, GOOGLE_CERTS_TIMEOUT.
+"""
+import datetime
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import requests
+from google.auth import jwt
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+# sin Cache-Control (no deberia pasar con Google)
+DEFAULT_MAX_AGE = 300
+FORCED_REFRESH_INTERVAL = 60
+RETRY_DELAY = 30
+MAX_AGE_PATTERN = re.compile(r'max-age=(\d+)')
+
+
+class GoogleCertsUnavailable(Exception):
+    pass
+
+
+def parse_max_age(headers):
+    match = MAX_AGE_PATTERN.search(headers.get('Cache-Control', ''))
+    max_age = int(match.group(1)) if match else DEFAULT_MAX_AGE
+    try:
+        # lo que la respuesta ya paso en caches intermedias
+        max_age -= int(headers.get('Age', 0))
+    except ValueError:
+        pass
+    return max(max_age, 0)
+
+
+class GoogleCertCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._certs = None
+        self._expires_at = 0.0
+        self._max_age = DEFAULT_MAX_AGE
+        self._file_mtime = None
+        self._last_forced = 0.0
+        self._next_attempt = 0.0
+        self._app = None
+        self._thread = None
+
+    def init_app(self, app):
+        app.config.setdefault('GOOGLE_CLIENT_ID', os.getenv(
+            'GOOGLE_CLIENT_ID', '413075624594-02qpect45v5o3uarjnkr42ldob11s4lk.apps.googleusercontent.com'))
+        app.config.setdefault('GOOGLE_CERTS_URL', os.getenv('GOOGLE_CERTS_URL', GOOGLE_CERTS_URL))
+        app.config.setdefault('GOOGLE_CERTS_CACHE_FILE', os.getenv(
+            'GOOGLE_CERTS_CACHE_FILE', os.path.join(app.instance_path, 'google-certs.json')))
+        app.config.setdefault('GOOGLE_CERTS_REFRESH_MARGIN', int(os.getenv('GOOGLE_CERTS_REFRESH_MARGIN', 300)))
+        app.config.setdefault('GOOGLE_CERTS_STALE_GRACE', int(os.getenv('GOOGLE_CERTS_STALE_GRACE', 6 * 3600)))
+        app.config.setdefault('GOOGLE_CERTS_TIMEOUT', float(os.getenv('GOOGLE_CERTS_TIMEOUT', 5)))
+        self._app = app
+
+    def get(self, force=False):
+        """
+        Certificados vigentes {kid: pem}. Con force se descargan aunque no hayan
+        caducado (kid desconocido). Lanza GoogleCertsUnavailable si no hay
+        ningunos que se puedan usar.
+        """
+        self._start()
+        now = time.time()
+        if not force and self._certs is not None and now < self._expires_at:
+            return self._certs
+        self._read_file()
+        if not force and self._certs is not None and now < self._expires_at:
+            return self._certs
+        if force:
+            if now - self._last_forced < FORCED_REFRESH_INTERVAL:
+                return self._usable(now)
+            self._last_forced = now
+        # con Google caido no se reintenta en cada login, solo cada RETRY_DELAY
+        if force or now >= self._next_attempt:
+            self.refresh()
+        return self._usable(time.time())
+
+    def _usable(self, now):
+        if self._certs is None or now > self._expires_at + self._app.config['GOOGLE_CERTS_STALE_GRACE']:
+            raise GoogleCertsUnavailable()
+        return self._certs
+
+    def _read_file(self):
+        path = self._app.config['GOOGLE_CERTS_CACHE_FILE']
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if mtime == self._file_mtime:
+                return
+            with open(path) as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            # el fichero puede ser de antes que lo que ya tenemos en memoria
+            if cached['expires_at'] >= self._expires_at:
+                self._certs, self._expires_at = cached['certs'], cached['expires_at']
+                self._max_age = cached['max_age']
+            self._file_mtime = mtime
+
+    def refresh(self):
+        # descarga los certificados; si otro worker ya lo esta haciendo se espera y se lee su fichero
+        config = self._app.config
+        path = config['GOOGLE_CERTS_CACHE_FILE']
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.lock', 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._read_file()
+                return
+            try:
+                response = requests.get(config['GOOGLE_CERTS_URL'], timeout=config['GOOGLE_CERTS_TIMEOUT'])
+                response.raise_for_status()
+                certs = response.json()
+            except (requests.RequestException, ValueError):
+                self._app.logger.warning("No se pudieron descargar las claves de Google", exc_info=True)
+                self._next_attempt = time.time() + RETRY_DELAY
+                return
+            max_age = parse_max_age(response.headers)
+            expires_at = time.time() + max_age
+            with open(path + '.tmp', 'w') as cache_file:
+                json.dump({"certs": certs, "expires_at": expires_at, "max_age": max_age}, cache_file)
+            os.replace(path + '.tmp', path)
+            with self._lock:
+                self._certs, self._expires_at, self._max_age = certs, expires_at, max_age
+                self._file_mtime = os.stat(path).st_mtime_ns
+
+    def _start(self):
+        # el hilo arranca con el primer login de Google: los comandos flask no lo necesitan
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='google-certs', daemon=True)
+        self._thread.start()
+
+    def _refresh_at(self):
+        # con un max-age corto el margen no puede comerse toda la vida de las claves
+        margin = min(self._app.config['GOOGLE_CERTS_REFRESH_MARGIN'], self._max_age / 2)
+        return self._expires_at - margin
+
+    def _run(self):
+        while True:
+            try:
+                self._read_file()
+                if time.time() >= self._refresh_at():
+                    self.refresh()
+            except Exception:
+                self._app.logger.exception("Fallo la renovacion de las claves de Google")
+            wait = self._refresh_at() - time.time()
+            # sin claves nuevas (Google caido) se reintenta en RETRY_DELAY
+            time.sleep(wait if wait > 0 else RETRY_DELAY)
+
+
+google_cert_cache = GoogleCertCache()
+
+
+def setup_google_certs(app):
+    google_cert_cache.init_app(app)
+
+
+def verify_google_id_token(token, audience):
+    """
+    Igual que id_token.verify_oauth2_token pero con las claves de la cache.
+    Lanza ValueError si el token no es valido.
+    """
+    kid = jwt.decode_header(token).get('kid')
+    certs = google_cert_cache.get()
+    if kid not in certs:
+        certs = google_cert_cache.get(force=True)
+    idinfo = jwt.decode(token, certs=certs, audience=audience)
+    if idinfo.get('iss') not in GOOGLE_ISSUERS:
+        raise ValueError("Wrong issuer")
+    return idinfo
+
+
+def make_stub_keys(key_id='stub-key'):
+    """
+    Par de claves RSA y certificado autofirmado para el servidor de claves de
+    prueba: devuelve (signer para firmar tokens, {kid: pem del certificado}).
+    Necesita cryptography, que esta en las dev-packages (pipenv install --dev).
+    """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+    from google.auth import crypt
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'google-certs-stub')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(
+        key.public_key()).serial_number(x509.random_serial_number()).not_valid_before(
+        now - datetime.timedelta(days=1)).not_valid_after(now + datetime.timedelta(days=30)).sign(key, hashes.SHA256())
+
+    private_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    signer = crypt.RSASigner.from_string(private_pem, key_id)
+    certs = {key_id: certificate.public_bytes(serialization.Encoding.PEM).decode('ascii')}
+    return signer, certs
+
+
+def make_stub_token(signer, audience, email, lifetime=3600):
+    now = int(time.time())
+    return jwt.encode(signer, {
+        "iss": "https://accounts.google.com", "aud": audience, "sub": email,
+        "email": email, "email_verified": True, "given_name": "Stub", "family_name": "User",
+        "iat": now, "exp": now + lifetime,
+    }).decode('ascii')
@@ -0,0 +1,113 @@
+"""
+Usuario actual de las rutas con @jwt_required: flask_jwt_extended lo carga una
+vez por peticion con el user_lookup_loader de aqui y las rutas lo leen con
+flask_jwt_extended.current_user.
+
+- Solo se cargan las columnas de UserIdentity (nada de password_hash ni tokens
+  de reset) y el resultado se guarda en una LRU de CURRENT_USER_CACHE_SIZE
+  usuarios durante CURRENT_USER_CACHE_TTL segundos.
+- Cualquier commit que modifique o borre un User lo quita de la cache del
+  proceso; los demas workers lo ven como mucho TTL segundos despues. Las rutas
+  que dependen de datos al dia (ETag del perfil) comparan updated_at y recargan.
+- Un token de un usuario que ya no existe recibe 401.
+
+Configuracion (variables de entorno o app.config):
+CURRENT_USER_CACHE_SIZE, CURRENT_USER_CACHE_TTL.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from api.models import db, User
+
+IDENTITY_COLUMNS = (User.id, User.username, User.email, User.first_name, User.last_name,
+                    User.bio, User.profile_image_url, User.role, User.is_active, User.updated_at)
+UserIdentity = namedtuple('UserIdentity', [column.key for column in IDENTITY_COLUMNS])
+
+
+class IdentityCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.max_size = 0
+        self.ttl = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, identity = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return identity
+
+    def put(self, identity):
+        with self._lock:
+            self._entries[identity.id] = (time.monotonic() + self.ttl, identity)
+            self._entries.move_to_end(identity.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = IdentityCache()
+
+
+def load_user_identity(user_id, refresh=False):
+    # UserIdentity del usuario o None si no existe; refresh salta la cache
+    if not refresh:
+        identity = identity_cache.get(user_id)
+        if identity is not None:
+            return identity
+    row = db.session.execute(db.select(*IDENTITY_COLUMNS).where(User.id == user_id)).first()
+    if row is None:
+        return None
+    identity = UserIdentity(*row)
+    identity_cache.put(identity)
+    return identity
+
+
+def setup_identity(app, jwt):
+    app.config.setdefault('CURRENT_USER_CACHE_SIZE', int(os.getenv('CURRENT_USER_CACHE_SIZE', 1024)))
+    app.config.setdefault('CURRENT_USER_CACHE_TTL', float(os.getenv('CURRENT_USER_CACHE_TTL', 30)))
+    identity_cache.max_size = app.config['CURRENT_USER_CACHE_SIZE']
+    identity_cache.ttl = app.config['CURRENT_USER_CACHE_TTL']
+
+    @jwt.user_lookup_loader
+    def user_lookup_callback(_jwt_header, jwt_data):
+        try:
+            return load_user_identity(int(jwt_data['sub']))
+        except (TypeError, ValueError):
+            return None
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    changed = {obj.id for obj in session.dirty | session.deleted if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault('changed_users', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    changed = session.info.pop('changed_users', None)
+    if changed:
+        identity_cache.invalidate(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop('changed_users', None)
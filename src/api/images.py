@@ -0,0 +1,312 @@
+"""
+Fotos de perfil: la subida solo guarda el fichero y comprueba la cabecera; la
+decodificacion y el redimensionado van a un pool de procesos acotado.
+
+Por cada foto se generan PICTURE_SIZES en el formato de origen (JPEG, o PNG si
+tiene transparencia) y en WebP, con la orientacion EXIF aplicada y sin metadatos.
+El original subido se borra al terminar; hasta entonces el usuario mantiene su
+foto anterior, y solo la cambia si no ha subido otra despues. Los nombres son
+<sha256>.<ext> (ver api/storage.py). /api/profile/picture/<filename>?size= sirve
+la variante ya generada (WebP si el navegador la acepta).
+
+Configuracion (variables de entorno o app.config):
+IMAGE_WORKERS (procesos), IMAGE_MAX_PENDING (fotos en cola, por encima 503),
+IMAGE_MAX_PIXELS (limite contra bombas de descompresion), PICTURE_MAX_BYTES
+(tamaño maximo del fichero subido, por encima 413), PICTURE_OFFLOAD y
+PICTURE_ACCEL_PREFIX (entregar el fichero desde el proxy), PICTURE_LEGACY_MAX_AGE,
+PICTURE_INDEX_REFRESH (segundos minimos entre relecturas de la carpeta de fotos).
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageOps, UnidentifiedImageError
+from flask import current_app, request
+from werkzeug.utils import send_file
+from api.models import db
+from api.storage import (STAGING_SUFFIX, VARIANT_SEPARATOR, CONTENT_HASH_PATTERN,
+                         mark_picture_ready, assign_pending_picture)
+
+# lado maximo en px; se conserva la proporcion
+PICTURE_SIZES = {'small': 64, 'medium': 256, 'large': 512}
+DEFAULT_PICTURE_SIZE = 'large'
+# formato de Pillow -> extension con la que se guarda
+ACCEPTED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png'}
+JPEG_QUALITY = 85
+PICTURE_MIMETYPES = {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+WEBP_QUALITY = 80
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def profile_pictures_folder():
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, 'src', 'front', 'assets', 'img', 'ProfilePictures')
+
+
+def variant_filename(filename, size, extension):
+    stem = filename.rsplit('.', 1)[0]
+    return f"{stem}{VARIANT_SEPARATOR}{size}.{extension}"
+
+
+def picture_filenames(filename):
+    # el original (fotos anteriores al pipeline) y todas sus variantes posibles
+    names = [variant_filename(filename, size, extension)
+             for size in PICTURE_SIZES for extension in ('jpg', 'png', 'webp')]
+    return names + [filename]
+
+
+def remove_picture_files(folder, filename):
+    names = picture_filenames(filename)
+    for name in names:
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            os.remove(path)
+    picture_index.discard(names)
+
+
+class PictureIndex:
+    """
+    Ficheros de la carpeta de fotos en memoria: servir una foto no toca el
+    disco hasta send_file. Se carga con un listdir la primera vez y se
+    actualiza al terminar cada procesado y al borrar. Lo que escribe otro
+    worker se descubre en un fallo releyendo la carpeta entera, como mucho una
+    vez cada max_age segundos: los 404 de fotos que no existen no tocan el disco.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = None
+        self._loaded_at = None
+        self.max_age = 5.0
+
+    def _load(self, folder, reload=False):
+        with self._lock:
+            now = time.monotonic()
+            if self._names is None or (reload and now - self._loaded_at >= self.max_age):
+                names = os.listdir(folder) if os.path.isdir(folder) else []
+                self._names = {name for name in names if not name.endswith((STAGING_SUFFIX, '.tmp'))}
+                self._loaded_at = now
+            return self._names
+
+    def add(self, names):
+        with self._lock:
+            if self._names is not None:
+                self._names.update(names)
+
+    def discard(self, names):
+        with self._lock:
+            if self._names is not None:
+                self._names.difference_update(names)
+
+    def find(self, folder, filename, size, webp):
+        """
+        Nombre del fichero a servir para la foto y el tamaño pedidos, o None.
+        Las fotos subidas antes del pipeline no tienen variantes y se sirven tal cual.
+        """
+        candidates = [variant_filename(filename, size, 'webp')] if webp else []
+        candidates += [variant_filename(filename, size, 'jpg'), variant_filename(filename, size, 'png'), filename]
+        for reload in (False, True):
+            names = self._load(folder, reload)
+            for candidate in candidates:
+                if candidate in names:
+                    return candidate
+        return None
+
+
+picture_index = PictureIndex()
+
+
+def serve_picture(folder, variant):
+    """
+    Respuesta para un fichero de la carpeta de fotos. Los nombres no cambian de
+    contenido (<sha256>-<size>.<ext>, o user_<id>_<fecha>.<ext> los antiguos),
+    asi que el ETag es el nombre y las de hash se cachean como immutable.
+    Con PICTURE_OFFLOAD el cuerpo lo manda el proxy (X-Sendfile o X-Accel-Redirect).
+    """
+    config = current_app.config
+    offload = config['PICTURE_OFFLOAD']
+    # nombres direccionados por contenido: el fichero nunca cambia
+    immutable = CONTENT_HASH_PATTERN.match(variant) is not None
+    max_age = IMMUTABLE_MAX_AGE if immutable else config['PICTURE_LEGACY_MAX_AGE']
+    path = os.path.join(folder, variant)
+
+    if offload == 'x-accel-redirect':
+        response = current_app.response_class(mimetype=_mimetype(variant))
+        response.headers['X-Accel-Redirect'] = config['PICTURE_ACCEL_PREFIX'].rstrip('/') + '/' + variant
+        response.set_etag(variant)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.make_conditional(request)
+    else:
+        response = send_file(path, request.environ, mimetype=_mimetype(variant), etag=variant,
+                             max_age=max_age, conditional=True,
+                             use_x_sendfile=offload == 'x-sendfile',
+                             response_class=current_app.response_class)
+    if immutable:
+        response.cache_control.immutable = True
+    response.vary.add('Accept')
+    return response
+
+
+def _mimetype(filename):
+    return PICTURE_MIMETYPES[filename.rsplit('.', 1)[1].lower()]
+
+
+def check_image_header(path, max_pixels):
+    """
+    Solo lee la cabecera (barato): formato y dimensiones antes de encolar el
+    trabajo. Devuelve la extension que corresponde al formato real del fichero.
+    """
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            width, height = image.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise InvalidImage("The file is not a valid image.")
+    if image_format not in ACCEPTED_FORMATS:
+        raise InvalidImage("Only PNG, JPG and JPEG files are allowed.")
+    if width * height > max_pixels:
+        raise InvalidImage("Image is too large.")
+    return ACCEPTED_FORMATS[image_format]
+
+
+def render_variants(source_path, folder, filename, max_pixels):
+    """
+    Corre en el pool de procesos: decodifica la foto y escribe todas sus variantes.
+    Cada variante se escribe en un temporal propio y se renombra, nunca se sirve a medias.
+    Devuelve los nombres escritos.
+    """
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        with Image.open(source_path) as image:
+            if image.format not in ACCEPTED_FORMATS:
+                raise InvalidImage("Only PNG, JPG and JPEG files are allowed.")
+            image.load()
+            image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise InvalidImage("The file is not a valid image.")
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    extension, save_options = ('png', {'format': 'PNG', 'optimize': True}) if has_alpha else \
+        ('jpg', {'format': 'JPEG', 'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True})
+
+    written = []
+    for size, side in PICTURE_SIZES.items():
+        variant = image.copy()
+        variant.thumbnail((side, side), Image.Resampling.LANCZOS)
+        for variant_extension, options in ((extension, save_options),
+                                           ('webp', {'format': 'WEBP', 'quality': WEBP_QUALITY, 'method': 4})):
+            name = variant_filename(filename, size, variant_extension)
+            # temporal unico: dos subidas del mismo contenido pueden renderizar a la vez
+            fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as tmp_file:
+                    variant.save(tmp_file, **options)
+                # mkstemp crea con 0600; el proxy (X-Accel-Redirect) tiene que poder leerlo
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, os.path.join(folder, name))
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            written.append(name)
+    return written
+
+
+class PicturePipeline:
+    def __init__(self):
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = None
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_WORKERS', int(os.getenv('IMAGE_WORKERS', 2)))
+        app.config.setdefault('IMAGE_MAX_PENDING', int(os.getenv('IMAGE_MAX_PENDING', 16)))
+        app.config.setdefault('IMAGE_MAX_PIXELS', int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000)))
+        app.config.setdefault('PICTURE_MAX_BYTES', int(os.getenv('PICTURE_MAX_BYTES', 5 * 1024 * 1024)))
+        # '' (lo manda la app), 'x-sendfile' (apache / lighttpd) o 'x-accel-redirect' (nginx)
+        app.config.setdefault('PICTURE_OFFLOAD', os.getenv('PICTURE_OFFLOAD', ''))
+        # location internal de nginx que apunta a la carpeta de fotos
+        app.config.setdefault('PICTURE_ACCEL_PREFIX', os.getenv('PICTURE_ACCEL_PREFIX', '/protected/profile-pictures/'))
+        app.config.setdefault('PICTURE_LEGACY_MAX_AGE', int(os.getenv('PICTURE_LEGACY_MAX_AGE', 24 * 3600)))
+        app.config.setdefault('PICTURE_INDEX_REFRESH', float(os.getenv('PICTURE_INDEX_REFRESH', 5)))
+        picture_index.max_age = app.config['PICTURE_INDEX_REFRESH']
+        self._app = app
+        self._slots = threading.BoundedSemaphore(app.config['IMAGE_MAX_PENDING'])
+
+    def _get_executor(self):
+        # el pool se crea con la primera subida; forkserver evita heredar hilos y conexiones del worker
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._app.config['IMAGE_WORKERS'],
+                    mp_context=multiprocessing.get_context('forkserver'))
+            return self._executor
+
+    def _reset_executor(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def submit(self, user_id, filename, staging_path):
+        """
+        Encola el procesado de la foto. Devuelve False si la cola esta llena o el
+        pool no acepta trabajos.
+        Al terminar bien, la foto pasa a ser la del usuario.
+        """
+        if not self._slots.acquire(blocking=False):
+            return False
+        job = (render_variants, staging_path, os.path.dirname(staging_path), filename,
+               self._app.config['IMAGE_MAX_PIXELS'])
+        try:
+            try:
+                future = self._get_executor().submit(*job)
+            except BrokenProcessPool:
+                # un proceso del pool murio (OOM, kill...): se crea uno nuevo
+                self._reset_executor()
+                future = self._get_executor().submit(*job)
+        except Exception:
+            self._slots.release()
+            self._app.logger.exception("No se pudo encolar la foto %s", filename)
+            return False
+        future.add_done_callback(lambda done: self._finish(done, user_id, filename, staging_path))
+        return True
+
+    def _finish(self, future, user_id, filename, staging_path):
+        self._slots.release()
+        try:
+            os.remove(staging_path)
+        except OSError:
+            pass
+
+        error = future.exception()
+        if error is not None:
+            # las variantes a medias quedan sin referencias y las borra flask gc-pictures
+            self._app.logger.warning("No se pudo procesar la foto %s: %s", filename, error)
+            return
+        picture_index.add(future.result())
+
+        with self._app.app_context():
+            try:
+                mark_picture_ready(filename)
+                # si mientras tanto subio otra foto (o cambio la suya) esta no se asigna; la borra el gc
+                assign_pending_picture(user_id, filename)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self._app.logger.exception("No se pudo guardar la foto %s del usuario %s", filename, user_id)
+
+
+picture_pipeline = PicturePipeline()
+
+
+def setup_image_pipeline(app):
+    picture_pipeline.init_app(app)
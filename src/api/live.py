@@ -0,0 +1,342 @@
+"""
+Eventos en vivo por Server-Sent Events: comentarios nuevos de una nota
+(GET /api/notes/<id>/events) y notificaciones del usuario (GET /api/notifications/events).
+
+- Las rutas anuncian lo que crean con announce(); se publica solo si la
+  transaccion se confirma. Con Postgres el anuncio es un NOTIFY dentro de la
+  propia transaccion y cada worker lo recibe por LISTEN; sin Postgres (SQLite en
+  local) se reparte dentro del proceso.
+- Los eventos solo llevan (canal, tipo, id). Un hilo por proceso carga las filas
+  en bloque, una vez por evento y no por cliente, y las reparte a las conexiones
+  abiertas de ese canal.
+- El id de cada evento es el id de la fila, asi que un cliente que reconecta con
+  Last-Event-ID recibe de la db lo que se perdio (hasta RESUME_LIMIT filas).
+- Cada stream ocupa un hilo mientras esta abierto (gunicorn con --worker-class
+  gthread, ver Procfile) y se cierra a los SSE_MAX_DURATION segundos; el navegador
+  reconecta solo. Por encima de SSE_MAX_STREAMS por proceso se responde 503 para
+  dejar hilos libres al resto de la API: con --threads 32 y SSE_MAX_STREAMS=16
+  cada worker guarda 16 hilos para las peticiones normales. La capacidad total es
+  WEB_CONCURRENCY (workers de gunicorn) x SSE_MAX_STREAMS; para mas clientes se
+  suben los workers, no SSE_MAX_STREAMS por encima de --threads.
+- EventSource no puede mandar cabeceras, asi que el stream de notificaciones se
+  autentica con ?jwt= y un token de stream: POST /api/notifications/events/token
+  (con el token normal en la cabecera) devuelve uno que caduca a los
+  SSE_TOKEN_TTL segundos y que solo vale para las rutas con
+  @stream_token_required; solo se comprueba al abrir, asi que el cliente pide
+  otro antes de cada reconexion. El token de sesion nunca va en la URL ni en
+  los logs.
+"""
+import json
+import os
+import queue
+import select
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+from flask import current_app, request, jsonify, Response, stream_with_context
+from flask_jwt_extended import create_access_token, verify_jwt_in_request
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session, joinedload
+from api.models import db, Comments, Notifications
+
+PG_CHANNEL = 'live_events'
+RESUME_LIMIT = 100
+RECONNECT_DELAY_MS = 3000
+SUBSCRIBER_QUEUE_SIZE = 256
+DISPATCH_BATCH_SIZE = 100
+LISTEN_RETRY_DELAY = 5
+# claim "scope" de los tokens de stream
+STREAM_TOKEN_SCOPE = 'live_events'
+
+# scope del canal -> (modelo, columna del canal, columna id, nombre del evento)
+STREAM_SCOPES = {
+    'note': (Comments, Comments.note_id, Comments.comment_id, 'comment'),
+    'user': (Notifications, Notifications.recipient_user_id, Notifications.notification_id, 'notification'),
+}
+
+
+def _load_options(kind):
+    # relaciones que usa serialize(); funcion porque los backref no existen al importar
+    if kind == 'comment':
+        return (joinedload(Comments.user),)
+    return (joinedload(Notifications.actor), joinedload(Notifications.note))
+
+
+def announce(scope, target_id, item_id):
+    """
+    Anuncia una fila nueva (comentario de la nota target_id o notificacion del
+    usuario target_id) a los streams abiertos, cuando se confirme la transaccion.
+    """
+    db.session.info.setdefault('live_events', []).append((scope, int(target_id), int(item_id)))
+
+
+def _load_items(scope, item_ids):
+    # {id: json serializado} cargando todas las filas de un tipo en una sola query
+    model, _, id_column, kind = STREAM_SCOPES[scope]
+    rows = model.query.filter(id_column.in_(item_ids)).options(*_load_options(kind)).all()
+    return {getattr(row, id_column.key): json.dumps(row.serialize()) for row in rows}
+
+
+def _format_event(scope, item_id, data):
+    return f"id: {item_id}\nevent: {STREAM_SCOPES[scope][3]}\ndata: {data}\n\n"
+
+
+class Subscription:
+    def __init__(self):
+        self.queue = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        # el cliente no consume al ritmo de los eventos: se le cierra y reanuda con Last-Event-ID
+        self.overflowed = False
+
+
+class LiveBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._inbox = queue.Queue()
+        self._app = None
+        self._started = False
+        self._streams = 0
+
+    def init_app(self, app):
+        app.config.setdefault('SSE_MAX_STREAMS', int(os.getenv('SSE_MAX_STREAMS', 16)))
+        app.config.setdefault('SSE_HEARTBEAT_INTERVAL', int(os.getenv('SSE_HEARTBEAT_INTERVAL', 15)))
+        app.config.setdefault('SSE_MAX_DURATION', int(os.getenv('SSE_MAX_DURATION', 300)))
+        app.config.setdefault('SSE_TOKEN_TTL', int(os.getenv('SSE_TOKEN_TTL', 60)))
+        self._app = app
+
+    def acquire_stream(self, max_streams):
+        with self._lock:
+            if self._streams >= max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def release_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    def subscribe(self, channel):
+        self._start()
+        subscription = Subscription()
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, channel, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def publish_local(self, events):
+        # solo encola lo que tiene algun stream abierto en este proceso
+        with self._lock:
+            events = [item for item in events if item[:2] in self._subscribers]
+        for item in events:
+            self._inbox.put(item)
+
+    def _start(self):
+        # los hilos arrancan con el primer stream: los comandos flask no los necesitan
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._dispatch_loop, name='live-dispatch', daemon=True).start()
+        with self._app.app_context():
+            if db.engine.dialect.name == 'postgresql':
+                threading.Thread(target=self._listen_loop, name='live-listen', daemon=True).start()
+
+    def _dispatch_loop(self):
+        while True:
+            batch = [self._inbox.get()]
+            while len(batch) < DISPATCH_BATCH_SIZE:
+                try:
+                    batch.append(self._inbox.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._dispatch(batch)
+            except Exception:
+                self._app.logger.exception("No se pudieron repartir %s eventos en vivo", len(batch))
+
+    def _dispatch(self, batch):
+        with self._lock:
+            targets = {(scope, target_id): list(self._subscribers.get((scope, target_id), ()))
+                       for scope, target_id, _ in batch}
+        ids_by_scope = {}
+        for scope, target_id, item_id in batch:
+            if targets[(scope, target_id)]:
+                ids_by_scope.setdefault(scope, set()).add(item_id)
+        if not ids_by_scope:
+            return
+
+        with self._app.app_context():
+            loaded = {scope: _load_items(scope, item_ids) for scope, item_ids in ids_by_scope.items()}
+        for scope, target_id, item_id in batch:
+            data = loaded.get(scope, {}).get(item_id)
+            if data is None:
+                continue
+            for subscription in targets[(scope, target_id)]:
+                try:
+                    subscription.queue.put_nowait((item_id, data))
+                except queue.Full:
+                    subscription.overflowed = True
+
+    def _listen_loop(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    connection = db.engine.raw_connection()
+                # conexion propia fuera del pool: queda en LISTEN mientras viva el proceso
+                connection.detach()
+                dbapi_connection = connection.driver_connection
+                try:
+                    dbapi_connection.autocommit = True
+                    with dbapi_connection.cursor() as cursor:
+                        cursor.execute(f"LISTEN {PG_CHANNEL}")
+                    while True:
+                        if not select.select([dbapi_connection], [], [], LISTEN_RETRY_DELAY)[0]:
+                            continue
+                        dbapi_connection.poll()
+                        while dbapi_connection.notifies:
+                            scope, target_id, item_id = json.loads(dbapi_connection.notifies.pop(0).payload)
+                            self.publish_local([(scope, target_id, item_id)])
+                finally:
+                    dbapi_connection.close()
+            except Exception:
+                self._app.logger.exception("Se perdio el LISTEN de eventos en vivo, reintentando")
+                time.sleep(LISTEN_RETRY_DELAY)
+
+
+live_broker = LiveBroker()
+
+
+def setup_live_events(app, jwt):
+    live_broker.init_app(app)
+
+    @jwt.token_verification_loader
+    def stream_token_only_on_streams(_jwt_header, jwt_data):
+        # un token de stream no sirve para el resto de la API, ni uno normal para los streams
+        view = current_app.view_functions.get(request.endpoint)
+        return (jwt_data.get('scope') == STREAM_TOKEN_SCOPE) == getattr(view, 'stream_token', False)
+
+    @jwt.token_verification_failed_loader
+    def wrong_token_kind(_jwt_header, _jwt_data):
+        return jsonify({"msg": "Token no valido para esta ruta"}), 401
+
+
+def create_stream_token(user_id):
+    """
+    Token para abrir un stream: el mismo usuario, SSE_TOKEN_TTL segundos de
+    vida y solo aceptado por las rutas con @stream_token_required.
+    """
+    return create_access_token(
+        identity=str(user_id),
+        expires_delta=timedelta(seconds=current_app.config['SSE_TOKEN_TTL']),
+        additional_claims={"scope": STREAM_TOKEN_SCOPE})
+
+
+def stream_token_required(fn):
+    # como @jwt_required, pero con un token de stream y solo en ?jwt=
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        verify_jwt_in_request(locations=['query_string'])
+        return fn(*args, **kwargs)
+    wrapper.stream_token = True
+    return wrapper
+
+
+def _last_event_id():
+    # EventSource lo manda en la cabecera al reconectar; ?last_event_id= para la primera conexion
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def stream_events(scope, target_id):
+    """
+    Respuesta text/event-stream del canal (scope, target_id): primero lo pendiente
+    desde Last-Event-ID, despues los eventos en vivo con un comentario de
+    heartbeat cada SSE_HEARTBEAT_INTERVAL segundos.
+    """
+    config = current_app.config
+    if not live_broker.acquire_stream(config['SSE_MAX_STREAMS']):
+        response = jsonify({"msg": "Demasiadas conexiones en vivo, intenta más tarde"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(RECONNECT_DELAY_MS // 1000)
+        return response
+
+    channel = (scope, target_id)
+    # suscritos antes de leer lo pendiente para no perder nada entre medias
+    subscription = live_broker.subscribe(channel)
+    last_event_id = _last_event_id()
+    heartbeat = config['SSE_HEARTBEAT_INTERVAL']
+    max_duration = config['SSE_MAX_DURATION']
+
+    def generate():
+        yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+        replayed_until = None
+        if last_event_id is not None:
+            model, channel_column, id_column, kind = STREAM_SCOPES[scope]
+            pending = model.query.filter(channel_column == target_id, id_column > last_event_id).options(
+                *_load_options(kind)).order_by(id_column).limit(RESUME_LIMIT).all()
+            for row in pending:
+                replayed_until = getattr(row, id_column.key)
+                yield _format_event(scope, replayed_until, json.dumps(row.serialize()))
+        # el resto del stream no usa la db: devolvemos la conexion al pool
+        db.session.remove()
+
+        deadline = time.monotonic() + max_duration
+        while not subscription.overflowed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item_id, data = subscription.queue.get(timeout=min(heartbeat, remaining))
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            if replayed_until is not None and item_id <= replayed_until:
+                continue
+            yield _format_event(scope, item_id, data)
+
+    def close():
+        live_broker.unsubscribe(channel, subscription)
+        live_broker.release_stream()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    # call_on_close tambien corre si el cliente se va antes de empezar a leer
+    response.call_on_close(close)
+    response.headers['Cache-Control'] = 'no-cache'
+    # nginx / proxies: no acumular el stream en buffer
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@event.listens_for(Session, 'before_commit')
+def _notify_postgres(session):
+    # NOTIFY es transaccional: Postgres solo lo entrega si el commit sale bien
+    events = session.info.get('live_events')
+    if not events or session.get_bind().dialect.name != 'postgresql':
+        return
+    session.info.pop('live_events')
+    for item in events:
+        session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                        {"channel": PG_CHANNEL, "payload": json.dumps(item)})
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_in_process(session):
+    events = session.info.pop('live_events', None)
+    if events:
+        live_broker.publish_local(events)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_live_events(session):
+    session.info.pop('live_events', None)
@@ -1,6 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Integer, String, Boolean, DateTime, Text, ForeignKey, func, Table
+from sqlalchemy.orm import Mapped, mapped_column, selectinload, joinedload
+from sqlalchemy import Integer, String, Boolean, DateTime, Text, Float, ForeignKey, func, Table, text
 import datetime
 
 db = SQLAlchemy()
@@ -18,6 +18,8 @@ class User(db.Model):
     last_name: Mapped[str] = mapped_column(String(100), nullable=False)
     bio: Mapped[str] = mapped_column(String(250), nullable=True)
     profile_image_url: Mapped[str] = mapped_column(String(255), nullable=True)
+    # ultima foto subida que aun se esta procesando (ver api/images.py)
+    pending_picture: Mapped[str] = mapped_column(String(255), nullable=True)
     role: Mapped[str] = mapped_column(
         String(20), nullable=False, default='user')
     password_reset_token: Mapped[str] = mapped_column(
@@ -27,10 +29,16 @@ class User(db.Model):
     last_login_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime, nullable=False, server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, server_default=func.now(), onupdate=datetime.datetime.utcnow)
     notes = db.relationship("Notes", backref="user")
     comments = db.relationship("Comments", backref="user")
     reports = db.relationship("Reports", backref="reporter")
-    notifications = db.relationship("Notifications", backref="recipient")
+    # contador mantenido por api/notifications.py: /notifications/unread-count sin COUNT(*)
+    unread_notifications: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default='0')
+    notifications = db.relationship(
+        "Notifications", backref="recipient", foreign_keys="Notifications.recipient_user_id")
     favorite_notes = db.relationship("UserNoteFavorites", backref="user")
     votes = db.relationship("Votes", backref="user")
 
@@ -61,10 +69,19 @@ class Notes(db.Model):
     title: Mapped[str] = mapped_column(String(100), nullable=False)
     content: Mapped[str] = mapped_column(nullable=False)
     is_anonymous: Mapped[bool] = mapped_column(Boolean(), nullable=False)
+    # NOT NULL: es la clave de la paginacion por cursor (created_at, note_id)
     created_at: Mapped[datetime] = mapped_column(
-        DateTime, default=datetime.datetime.utcnow)
+        DateTime, nullable=False, default=datetime.datetime.utcnow, server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.datetime.utcnow)
+    # contadores desnormalizados, los mantiene create_vote en la misma transaccion
+    positive_votes: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default='0')
+    negative_votes: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default='0')
+    # version de la nota completa (votos, comentarios, favoritos); sirve de ETag
+    version: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default='0')
     tags = db.relationship("Tags", secondary=note_tags, backref="notes")
     reports = db.relationship(
         "Reports", backref="note", cascade="all, delete-orphan")
@@ -80,11 +97,14 @@ class Notes(db.Model):
         cascade="all, delete-orphan"
     )
 
+    # indices para la paginacion por cursor (created_at, note_id)
+    __table_args__ = (
+        db.Index('ix_notes_created_at_note_id', 'created_at', 'note_id'),
+        db.Index('ix_notes_user_id_created_at_note_id',
+                 'user_id', 'created_at', 'note_id'),
+    )
+
     def serialize(self):
-        # Obtener contadores de votos - CORREGIDO (sin import circular)
-        positive_votes = sum(1 for vote in self.votes if vote.vote_type == 1)
-        negative_votes = sum(1 for vote in self.votes if vote.vote_type == -1)
-        
         # Esta es la parte que valida si la nota es anónima o no
         user_info = None
         if not self.is_anonymous:
@@ -108,23 +128,41 @@ class Notes(db.Model):
             "comments": [comment.serialize() for comment in self.comments],
             "reports": [report.serialize() for report in self.reports],
             "favorited_by": [fav.serialize() for fav in self.favorited_by],
-            "votes": [vote.serialize() for vote in self.votes],
             "user_info": user_info,
-            "positive_votes": positive_votes,
-            "negative_votes": negative_votes,
+            **vote_counts('note', self.note_id, self.positive_votes, self.negative_votes),
             "comments_count": len(self.comments)
         }
 
+# Documento de busqueda full-text (solo Postgres): titulo con peso A y contenido
+# con peso B. El indice GIN usa exactamente esta expresion, asi que las queries
+# de api/search.py deben construirla con esta misma funcion.
+SEARCH_CONFIG = text("'spanish'::regconfig")
+
+
+def note_search_document():
+    return func.setweight(func.to_tsvector(SEARCH_CONFIG, Notes.title), text("'A'")).op('||')(
+        func.setweight(func.to_tsvector(SEARCH_CONFIG, Notes.content), text("'B'")))
+
+
+db.Index('ix_notes_search_document', note_search_document(),
+         postgresql_using='gin').ddl_if(dialect='postgresql')
+
+
 class Comments (db.Model):
     comment_id: Mapped[int] = mapped_column(primary_key=True)
     note_id: Mapped[int] = mapped_column(
         ForeignKey("notes.note_id"), nullable=False)
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=False)
     content: Mapped[str] = mapped_column(nullable=False)
+    # NOT NULL: es la clave de la paginacion por cursor (created_at, comment_id)
     created_at: Mapped[datetime] = mapped_column(
-        DateTime, default=datetime.datetime.utcnow)
+        DateTime, nullable=False, default=datetime.datetime.utcnow, server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(
         DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+    positive_votes: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default='0')
+    negative_votes: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default='0')
     reports = db.relationship(
         "Reports", backref="comment", cascade="all, delete-orphan")
     notifications = db.relationship(
@@ -132,6 +170,12 @@ class Comments (db.Model):
     votes = db.relationship("Votes", backref="comment",
                             cascade="all, delete-orphan")
 
+    # comentarios de una nota paginados por (created_at, comment_id)
+    __table_args__ = (
+        db.Index('ix_comments_note_id_created_at_comment_id',
+                 'note_id', 'created_at', 'comment_id'),
+    )
+
     def serialize(self):
         return {
             "comment_id": self.comment_id,
@@ -141,15 +185,49 @@ class Comments (db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "username": self.user.username if self.user else "Usuario eliminado",
             "first_name": self.user.first_name if self.user else "",
-            "last_name": self.user.last_name if self.user else ""
+            "last_name": self.user.last_name if self.user else "",
+            **vote_counts('comment', self.comment_id, self.positive_votes, self.negative_votes)
         }
 
 
+def comment_list_columns():
+    """
+    Columnas de los comentarios mas el nombre del autor con un unico LEFT JOIN,
+    sin cargar la entidad User entera. Las filas se serializan con serialize_comment_row.
+    """
+    return (
+        Comments.comment_id, Comments.note_id, Comments.user_id, Comments.content,
+        Comments.created_at, Comments.positive_votes, Comments.negative_votes,
+        User.username, User.first_name, User.last_name,
+    )
+
+
+def serialize_comment_row(row):
+    # mismo formato que Comments.serialize
+    return {
+        "comment_id": row.comment_id,
+        "note_id": row.note_id,
+        "user_id": row.user_id,
+        "content": row.content,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "username": row.username if row.username is not None else "Usuario eliminado",
+        "first_name": row.first_name or "",
+        "last_name": row.last_name or "",
+        **vote_counts('comment', row.comment_id, row.positive_votes, row.negative_votes)
+    }
+
+
 class Tags(db.Model):
     tag_id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
     color_hex: Mapped[str] = mapped_column(String(7), nullable=True)
 
+    # indice trigram (pg_trgm) para busquedas por prefijo o fragmento con ILIKE
+    __table_args__ = (
+        db.Index('ix_tags_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+
     def serialize(self):
         return {
             "tag_id": self.tag_id,
@@ -184,8 +262,34 @@ class Notifications(db.Model):
         ForeignKey("comments.comment_id"), nullable=True)
     is_read: Mapped[bool] = mapped_column(
         Boolean, nullable=False, default=False)
+    # default en Python (con microsegundos) para que la paginacion por cursor no empate
     created_at: Mapped[datetime.datetime] = mapped_column(
-        DateTime, nullable=False, server_default=func.now())
+        DateTime, nullable=False, default=datetime.datetime.utcnow, server_default=func.now())
+    # 'comment', 'vote' o 'favorite'
+    kind: Mapped[str] = mapped_column(String(20), nullable=False)
+    # quien comento / voto / guardo la nota
+    actor_user_id: Mapped[int] = mapped_column(
+        ForeignKey("user.id"), nullable=True)
+    actor = db.relationship("User", foreign_keys=[actor_user_id])
+
+    # bandeja de cada usuario paginada por (created_at, notification_id)
+    __table_args__ = (
+        db.Index('ix_notifications_recipient_user_id_created_at_notification_id',
+                 'recipient_user_id', 'created_at', 'notification_id'),
+    )
+
+    def serialize(self):
+        return {
+            "notification_id": self.notification_id,
+            "kind": self.kind,
+            "note_id": self.note_id,
+            "note_title": self.note.title if self.note else None,
+            "comment_id": self.comment_id,
+            # los votos son anonimos
+            "actor_username": self.actor.username if self.actor and self.kind != 'vote' else None,
+            "is_read": self.is_read,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
 
 
 class UserNoteFavorites(db.Model):
@@ -216,6 +320,19 @@ class Votes(db.Model):
         ForeignKey("comments.comment_id"), nullable=True)
     # 1 para voto positivo, -1 para negativo
     vote_type: Mapped[int] = mapped_column(Integer, nullable=False)
+    # solo lo escribe el ON CONFLICT DO UPDATE del upsert: NULL = el voto nunca cambio
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=True)
+
+    # un voto por usuario y nota / comentario; tambien sirven para "mis votos"
+    # y como objetivo del INSERT ... ON CONFLICT de create_vote
+    __table_args__ = (
+        db.Index('uq_votes_user_id_note_id', 'user_id', 'note_id', unique=True,
+                 postgresql_where=text('note_id IS NOT NULL'),
+                 sqlite_where=text('note_id IS NOT NULL')),
+        db.Index('uq_votes_user_id_comment_id', 'user_id', 'comment_id', unique=True,
+                 postgresql_where=text('comment_id IS NOT NULL'),
+                 sqlite_where=text('comment_id IS NOT NULL')),
+    )
     
     def serialize(self):
         return {
@@ -224,4 +341,121 @@ class Votes(db.Model):
             "note_id": self.note_id,
             "comment_id": self.comment_id,
             "vote_type": self.vote_type
-        }
\ No newline at end of file
+        }
+
+
+class PictureBlobs(db.Model):
+    # una fila por foto de perfil guardada (<sha256>.<ext>, ver api/storage.py);
+    # ref_count = usuarios cuyo profile_image_url apunta a ella
+    filename: Mapped[str] = mapped_column(String(255), primary_key=True)
+    ref_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default='0')
+    # variantes ya generadas: una subida igual se asigna sin volver a procesarla
+    ready: Mapped[bool] = mapped_column(
+        Boolean(), nullable=False, default=False, server_default=text('false'))
+    updated_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
+class VoteLogCheckpoints(db.Model):
+    # logs de votos de api/vote_buffer.py ya aplicados a los contadores; se escribe
+    # en la misma transaccion que los deltas para que el replay no los duplique
+    log_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    applied_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+
+class RateLimitBuckets(db.Model):
+    # cubos del rate limit de autenticacion compartidos entre workers (api/rate_limit.py)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+    # epoch en segundos: el relleno se calcula en el propio upsert
+    updated_at: Mapped[float] = mapped_column(Float, nullable=False)
+    # resultado de la ultima comprobacion, lo devuelve el RETURNING del upsert
+    allowed: Mapped[bool] = mapped_column(Boolean(), nullable=False)
+
+
+# Deltas de votos ya aceptados pero aun no volcados a notes/comments (modo
+# write-behind, ver api/vote_buffer.py): {("note" | "comment", id): [positivos, negativos]}.
+# Todas las lecturas de contadores pasan por vote_counts() para sumarlos.
+unflushed_vote_deltas = {}
+# {note_id: secuencia del ultimo voto sin volcar en la nota o sus comentarios}.
+# Notes.version solo sube al volcar; los ETag usan note_etag_version() para que
+# un voto pendiente tambien los cambie.
+unflushed_note_votes = {}
+
+
+def vote_counts(kind, target_id, positive_votes, negative_votes):
+    positive_delta, negative_delta = unflushed_vote_deltas.get((kind, target_id), (0, 0))
+    return {
+        "positive_votes": positive_votes + positive_delta,
+        "negative_votes": negative_votes + negative_delta
+    }
+
+
+def note_etag_version(note_id, version):
+    pending = unflushed_note_votes.get(note_id)
+    return version if pending is None else f"{version}+{pending}"
+
+
+def note_last_modified(note_id, updated_at):
+    # con votos sin volcar updated_at no se ha movido: If-Modified-Since no sirve de validador
+    return None if note_id in unflushed_note_votes else updated_at
+
+
+def touch_note(note_id, **values):
+    """
+    Sube la version (y updated_at) de la nota dentro de la transaccion actual.
+    Hay que llamarla en todo cambio que altere lo que devuelven get_note_by_id,
+    get_comments o Notes.serialize, porque de ahi salen los ETag / Last-Modified.
+    note_id puede ser un valor o una subquery escalar.
+    """
+    db.session.execute(
+        db.update(Notes).where(Notes.note_id == note_id).values(
+            version=Notes.version + 1,
+            updated_at=datetime.datetime.utcnow(),
+            **values
+        ).execution_options(synchronize_session=False)
+    )
+
+
+def apply_vote_deltas(kind, target_id, positive_delta, negative_delta):
+    """
+    Suma los deltas a positive_votes / negative_votes de la nota o del comentario
+    con un UPDATE atomico (col = col + delta) dentro de la transaccion actual.
+    """
+    if not positive_delta and not negative_delta:
+        return
+
+    if kind == 'note':
+        touch_note(
+            target_id,
+            positive_votes=Notes.positive_votes + positive_delta,
+            negative_votes=Notes.negative_votes + negative_delta
+        )
+        return
+
+    db.session.execute(
+        db.update(Comments).where(Comments.comment_id == target_id).values(
+            positive_votes=Comments.positive_votes + positive_delta,
+            negative_votes=Comments.negative_votes + negative_delta,
+            # un voto no es una edicion: no disparamos el onupdate de updated_at
+            updated_at=Comments.updated_at
+        ).execution_options(synchronize_session=False)
+    )
+    touch_note(db.select(Comments.note_id).where(
+        Comments.comment_id == target_id).scalar_subquery())
+
+
+def note_serialize_options():
+    """
+    Opciones de carga para listas de notas: trae todas las relaciones que usa
+    Notes.serialize en un numero constante de queries (sin N+1).
+    """
+    return (
+        joinedload(Notes.user),
+        selectinload(Notes.tags),
+        selectinload(Notes.reports),
+        selectinload(Notes.comments).joinedload(Comments.user),
+        selectinload(Notes.favorited_by).joinedload(UserNoteFavorites.user),
+    )
@@ -0,0 +1,100 @@
+"""
+Notificaciones para el autor de una nota cuando alguien la comenta, la vota o
+la guarda en favoritos.
+
+- Las rutas solo encolan el evento en la sesion (notify_note_owner). Tras el
+  commit se entregan en un hilo aparte, asi la peticion nunca espera por ellas;
+  si la transaccion se deshace se descartan.
+- Cada entrega inserta las notificaciones en bloque y suma al contador
+  User.unread_notifications en la misma transaccion. Marcar como leidas y borrar
+  notificaciones sin leer (en cascada con notas/comentarios) lo descuenta, asi
+  /notifications/unread-count es una lectura por clave primaria.
+- Las notificaciones entregadas se empujan a /notifications/events (ver api/live.py).
+- flask reconcile-notification-counts recalcula el contador si se desviara.
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from api.models import db, Notes, Notifications, User
+from api.live import announce
+
+NOTIFICATION_KINDS = ('comment', 'vote', 'favorite')
+
+# un solo hilo: las entregas se serializan y no compiten entre si por las filas de user
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notifications')
+
+
+def notify_note_owner(kind, note_id, actor_user_id, comment_id=None):
+    """
+    Encola una notificacion para el autor de la nota; se entrega despues del
+    commit de la sesion actual. No se notifica a quien actua sobre su propia nota.
+    """
+    db.session.info.setdefault('notifications', []).append({
+        "kind": kind,
+        "note_id": int(note_id),
+        "comment_id": comment_id,
+        "actor_user_id": int(actor_user_id),
+    })
+
+
+def add_unread(connection, unread_by_user):
+    # updated_at se deja igual: el contador no forma parte del perfil ni de su ETag
+    user_table = User.__table__
+    for user_id, delta in sorted(unread_by_user.items()):
+        connection.execute(
+            user_table.update().where(user_table.c.id == user_id).values(
+                unread_notifications=user_table.c.unread_notifications + delta,
+                updated_at=user_table.c.updated_at))
+
+
+def deliver_notifications(app, events):
+    with app.app_context():
+        try:
+            note_ids = {item["note_id"] for item in events}
+            owners = dict(db.session.query(Notes.note_id, Notes.user_id).filter(
+                Notes.note_id.in_(note_ids)).all())
+
+            rows = []
+            for item in events:
+                recipient = owners.get(item["note_id"])
+                # nota ya borrada o el autor actuando sobre su propia nota
+                if recipient is None or recipient == item["actor_user_id"]:
+                    continue
+                rows.append(dict(item, recipient_user_id=recipient))
+            if not rows:
+                return
+
+            inserted = db.session.execute(
+                db.insert(Notifications).returning(
+                    Notifications.notification_id, Notifications.recipient_user_id), rows)
+            for notification_id, recipient in inserted:
+                announce('user', recipient, notification_id)
+            add_unread(db.session.connection(),
+                       Counter(row["recipient_user_id"] for row in rows))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("No se pudieron entregar %s notificaciones", len(events))
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_notifications(session):
+    events = session.info.pop('notifications', None)
+    if events:
+        _executor.submit(deliver_notifications, current_app._get_current_object(), events)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_notifications(session):
+    session.info.pop('notifications', None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _discount_deleted_unread(session, flush_context):
+    # notificaciones sin leer borradas (p.ej. en cascada al borrar una nota o un comentario)
+    unread = Counter(obj.recipient_user_id for obj in session.deleted
+                     if isinstance(obj, Notifications) and not obj.is_read)
+    if unread:
+        add_unread(session.connection(), {user_id: -count for user_id, count in unread.items()})
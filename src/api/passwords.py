@@ -0,0 +1,88 @@
+"""
+Hash y comprobacion de contraseñas (bcrypt) fuera del hilo de la peticion.
+
+bcrypt cuesta ~250 ms de CPU con el coste por defecto; hecho en linea, una
+rafaga de logins ocupa todos los hilos del worker de gunicorn y el resto de la
+API se queda esperando. Aqui van a un pool de PASSWORD_WORKERS hilos (bcrypt
+suelta el GIL mientras calcula), asi como mucho esos hilos gastan CPU en
+contraseñas a la vez. Con mas de PASSWORD_MAX_PENDING trabajos en cola se
+responde 503 en lugar de encolar sin limite.
+
+El coste (BCRYPT_LOG_ROUNDS) se puede cambiar cuando se quiera: las
+contraseñas con otro coste se vuelven a hashear al hacer login.
+
+Configuracion (variables de entorno o app.config):
+BCRYPT_LOG_ROUNDS, PASSWORD_WORKERS, PASSWORD_MAX_PENDING.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask_bcrypt import Bcrypt
+
+bcrypt = Bcrypt()
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def hash_rounds(password_hash):
+    # "$2b$12$<salt+hash>" -> 12; None si no es un hash de bcrypt (p.ej. usuarios de Google)
+    parts = password_hash.split('$')
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _verify(password_hash, password, rounds):
+    try:
+        valid = bcrypt.check_password_hash(password_hash, password)
+    except ValueError:
+        # hash vacio o con otro formato
+        return False, None
+    if valid and hash_rounds(password_hash) != rounds:
+        return True, bcrypt.generate_password_hash(password, rounds).decode('utf-8')
+    return valid, None
+
+
+class PasswordHasher:
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', int(os.getenv('BCRYPT_LOG_ROUNDS', 12)))
+        app.config.setdefault('PASSWORD_WORKERS', int(os.getenv('PASSWORD_WORKERS', 2)))
+        app.config.setdefault('PASSWORD_MAX_PENDING', int(os.getenv('PASSWORD_MAX_PENDING', 16)))
+        bcrypt.init_app(app)
+        self._rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self._executor = ThreadPoolExecutor(
+            max_workers=app.config['PASSWORD_WORKERS'], thread_name_prefix='passwords')
+        self._slots = threading.BoundedSemaphore(app.config['PASSWORD_MAX_PENDING'])
+
+    def _run(self, function, *args):
+        # espera el resultado: la peticion sigue ocupando su hilo, pero no CPU
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            return self._executor.submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(lambda: bcrypt.generate_password_hash(password, self._rounds).decode('utf-8'))
+
+    def verify(self, password_hash, password):
+        """
+        Devuelve (valida, hash_nuevo). hash_nuevo no es None si la contraseña es
+        correcta pero su hash tiene otro coste: hay que guardarlo en el usuario.
+        """
+        return self._run(_verify, password_hash, password, self._rounds)
+
+
+password_hasher = PasswordHasher()
+
+
+def setup_password_hasher(app):
+    password_hasher.init_app(app)
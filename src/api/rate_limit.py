@@ -0,0 +1,167 @@
+"""
+Control de admision de /api/token y /api/user: token bucket por IP y por email.
+
+Cada clave tiene un cubo de AUTH_RATE_*_BURST fichas que se rellena a razon de
+BURST fichas cada AUTH_RATE_*_PERIOD segundos; cada peticion gasta una. Sin
+ficha se responde 429 con Retry-After antes de leer la db o llamar a bcrypt,
+asi una rafaga de credential stuffing no se come la CPU del resto de la API.
+
+- Por defecto los cubos viven en memoria del proceso (LRU de AUTH_RATE_MAX_KEYS
+  claves): cada worker de gunicorn limita por su cuenta.
+- Con AUTH_RATE_SHARED=1 los cubos estan en la tabla rate_limit_buckets y
+  todos los workers (y maquinas) comparten el limite; cada comprobacion es un
+  solo upsert. Si la db falla se usa el cubo local.
+- Detras de un proxy la IP sale de X-Forwarded-For: AUTH_RATE_PROXY_COUNT es
+  cuantos proxies de confianza hay delante (1 en Render).
+
+Configuracion (variables de entorno o app.config):
+AUTH_RATE_LIMIT, AUTH_RATE_IP_BURST, AUTH_RATE_IP_PERIOD, AUTH_RATE_EMAIL_BURST,
+AUTH_RATE_EMAIL_PERIOD, AUTH_RATE_SHARED, AUTH_RATE_MAX_KEYS, AUTH_RATE_PROXY_COUNT.
+"""
+import functools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request, jsonify
+from sqlalchemy import case
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from api.models import db, RateLimitBuckets
+
+# cada cuanto se borran de la tabla los cubos que ya estarian llenos
+PRUNE_INTERVAL = 300
+
+
+class LocalBuckets:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def consume(self, key, burst, rate, now, max_keys):
+        # (permitido, segundos hasta la siguiente ficha)
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            # un cubo descartado equivale a uno lleno: se pierde como mucho un limite
+            while len(self._buckets) > max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+def consume_shared(key, burst, rate, now):
+    """
+    Gasta una ficha del cubo key en rate_limit_buckets con un solo upsert que
+    rellena, limita a burst y descuenta en la propia db.
+    """
+    bucket = RateLimitBuckets.__table__.c
+    refilled = bucket.tokens + (now - bucket.updated_at) * rate
+    refilled = case((refilled > burst, burst), else_=refilled)
+    with db.engine.begin() as connection:
+        insert = postgresql_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+        statement = insert(RateLimitBuckets).values(key=key, tokens=burst - 1, updated_at=now, allowed=True)
+        statement = statement.on_conflict_do_update(
+            index_elements=['key'],
+            set_={"tokens": case((refilled >= 1, refilled - 1), else_=refilled),
+                  "updated_at": now,
+                  "allowed": refilled >= 1})
+        tokens, allowed = connection.execute(
+            statement.returning(RateLimitBuckets.tokens, RateLimitBuckets.allowed)).one()
+    return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class AuthRateLimiter:
+    def __init__(self):
+        self._local = LocalBuckets()
+        self._next_prune = 0.0
+
+    def init_app(self, app):
+        app.config.setdefault('AUTH_RATE_LIMIT', os.getenv('AUTH_RATE_LIMIT', '1') == '1')
+        app.config.setdefault('AUTH_RATE_IP_BURST', int(os.getenv('AUTH_RATE_IP_BURST', 20)))
+        app.config.setdefault('AUTH_RATE_IP_PERIOD', float(os.getenv('AUTH_RATE_IP_PERIOD', 60)))
+        app.config.setdefault('AUTH_RATE_EMAIL_BURST', int(os.getenv('AUTH_RATE_EMAIL_BURST', 5)))
+        app.config.setdefault('AUTH_RATE_EMAIL_PERIOD', float(os.getenv('AUTH_RATE_EMAIL_PERIOD', 60)))
+        app.config.setdefault('AUTH_RATE_SHARED', os.getenv('AUTH_RATE_SHARED') == '1')
+        app.config.setdefault('AUTH_RATE_MAX_KEYS', int(os.getenv('AUTH_RATE_MAX_KEYS', 10000)))
+        app.config.setdefault('AUTH_RATE_PROXY_COUNT', int(os.getenv('AUTH_RATE_PROXY_COUNT', 0)))
+
+    def consume(self, key, burst, period, now=None):
+        config = current_app.config
+        now = time.time() if now is None else now
+        rate = burst / period
+        if config['AUTH_RATE_SHARED']:
+            try:
+                result = consume_shared(key, burst, rate, now)
+                self._prune(now)
+                return result
+            except Exception:
+                current_app.logger.exception("Fallo el rate limit compartido, se usa el local")
+        return self._local.consume(key, burst, rate, now, config['AUTH_RATE_MAX_KEYS'])
+
+    def _prune(self, now):
+        if now < self._next_prune:
+            return
+        self._next_prune = now + PRUNE_INTERVAL
+        config = current_app.config
+        # sin peticiones en un periodo entero el cubo ya esta lleno: borrarlo no cambia nada
+        oldest = now - max(config['AUTH_RATE_IP_PERIOD'], config['AUTH_RATE_EMAIL_PERIOD'])
+        with db.engine.begin() as connection:
+            connection.execute(db.delete(RateLimitBuckets).where(RateLimitBuckets.updated_at < oldest))
+
+    def check(self, email):
+        """
+        None si la peticion puede seguir; si no, los segundos que tiene que
+        esperar el cliente.
+        """
+        config = current_app.config
+        limits = [(f"ip:{client_ip()}", config['AUTH_RATE_IP_BURST'], config['AUTH_RATE_IP_PERIOD'])]
+        if email:
+            limits.append((f"email:{email.strip().lower()}",
+                           config['AUTH_RATE_EMAIL_BURST'], config['AUTH_RATE_EMAIL_PERIOD']))
+        for key, burst, period in limits:
+            allowed, retry_after = self.consume(key, burst, period)
+            if not allowed:
+                return retry_after
+        return None
+
+
+auth_rate_limiter = AuthRateLimiter()
+
+
+def setup_rate_limit(app):
+    auth_rate_limiter.init_app(app)
+
+
+def client_ip():
+    proxies = current_app.config['AUTH_RATE_PROXY_COUNT']
+    forwarded = request.headers.get('X-Forwarded-For')
+    if proxies and forwarded:
+        # cada proxy añade la IP que le llega al final: la del cliente es la N-esima desde la derecha
+        hops = [hop.strip() for hop in forwarded.split(',')]
+        return hops[-min(proxies, len(hops))]
+    return request.remote_addr
+
+
+def auth_rate_limited(view):
+    """
+    Decorador de las rutas de autenticacion: 429 antes de ejecutar la vista si
+    la IP o el email del cuerpo JSON se pasaron del limite.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_app.config['AUTH_RATE_LIMIT']:
+            body = request.get_json(silent=True)
+            email = body.get('email') if isinstance(body, dict) else None
+            retry_after = auth_rate_limiter.check(email if isinstance(email, str) else None)
+            if retry_after is not None:
+                response = jsonify({"error": "Demasiados intentos, espera antes de volver a intentarlo"})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                return response
+        return view(*args, **kwargs)
+    return wrapper
@@ -1,20 +1,37 @@
-from flask import Flask, request, jsonify, url_for, Blueprint, redirect, flash, send_from_directory
-from api.models import db, User, Notes, Tags, Comments, Votes
-from api.utils import generate_sitemap, APIException
+from flask import Flask, request, jsonify, url_for, Blueprint, redirect, flash, send_from_directory, current_app
+from api.models import db, User, Notes, Tags, Comments, Votes, Notifications, note_tags, note_serialize_options, \
+    touch_note, apply_vote_deltas, vote_counts, comment_list_columns, serialize_comment_row, \
+    note_etag_version, note_last_modified
+from api.utils import generate_sitemap, APIException, paginate_keyset, conditional_response, make_etag, \
+    stream_list_response, STREAM_BATCH_SIZE, parse_id, parse_id_list, MAX_BATCH_IDS, get_page_limit
+from api.search import search_notes
+from api.tags import tag_catalog, DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS
+from api.vote_buffer import vote_buffer
+from api.notifications import notify_note_owner
+from api.live import announce, stream_events, create_stream_token, stream_token_required
+from api.passwords import password_hasher, PasswordHasherBusy
+from api.rate_limit import auth_rate_limited
+from api.images import picture_pipeline, picture_index, serve_picture, profile_pictures_folder, \
+    check_image_header, InvalidImage, PICTURE_SIZES, DEFAULT_PICTURE_SIZE
+from api.storage import save_upload, register_picture, assign_profile_picture, set_pending_picture, \
+    UploadTooLarge, MULTIPART_OVERHEAD
 from flask_cors import CORS
-from flask_bcrypt import Bcrypt
 from flask_jwt_extended import create_access_token
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
 import datetime
 import os
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from api.models import UserNoteFavorites
-from google.auth.transport import requests as google_requests
-from google.oauth2 import id_token
+from api.google_certs import verify_google_id_token, GoogleCertsUnavailable
+from api.identity import load_user_identity
 
 api = Blueprint('api', __name__)
-bcrypt = Bcrypt()
 
 
 
@@ -29,99 +46,104 @@ def allowed_file(filename):
 @jwt_required()
 def upload_profile_picture():
     current_user_id = get_jwt_identity()
+    max_bytes = current_app.config['PICTURE_MAX_BYTES']
+
+    # limite del cuerpo antes de parsearlo: werkzeug corta sin leer el resto
+    request.max_content_length = max_bytes + MULTIPART_OVERHEAD
+    try:
+        files = request.files
+    except RequestEntityTooLarge:
+        return jsonify({"error": "File too large"}), 413
 
     # Check if the post request has the file part
-    if 'file' not in request.files:
+    if 'file' not in files:
         return jsonify({"error": "No file part in the request"}), 400
 
-    file = request.files['file']
+    file = files['file']
 
     # If user does not select file, browser submits empty file without filename
     if file.filename == '':
         return jsonify({"error": "No file selected"}), 400
 
     if file and allowed_file(file.filename):
-        # Create a unique filename using user ID and timestamp
-        file_extension = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"user_{current_user_id}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{file_extension}"
-        filename = secure_filename(filename)
-
-        # Ensure upload directory exists
-        # Use absolute path to avoid issues with relative paths
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        upload_folder = os.path.join(base_dir, 'src', 'front', 'assets', 'img', 'ProfilePictures')
-        
-        print(f"📁 Base directory: {base_dir}")
-        print(f"📁 Upload folder: {upload_folder}")
-        
-        if not os.path.exists(upload_folder):
-            print(f"📁 Creating upload directory: {upload_folder}")
-            os.makedirs(upload_folder, exist_ok=True)
-
-        # Save the file
-        file_path = os.path.join(upload_folder, filename)
-        print(f"💾 Saving file to: {file_path}")
-        file.save(file_path)
-        
-        # Verify file was saved
-        if os.path.exists(file_path):
-            print(f"✅ File saved successfully: {file_path}")
-            print(f"📏 File size: {os.path.getsize(file_path)} bytes")
-        else:
-            print(f"❌ File was not saved: {file_path}")
-
-        # Update user's profile_image_url in database
-        user = User.query.get(current_user_id)
-        if user:
-            user.profile_image_url = filename
+        upload_folder = profile_pictures_folder()
+        os.makedirs(upload_folder, exist_ok=True)
+
+        # el original solo se guarda para el pool de procesos, que genera las variantes
+        try:
+            staging_path, digest = save_upload(file, upload_folder, max_bytes)
+        except UploadTooLarge:
+            return jsonify({"error": "File too large"}), 413
+        try:
+            extension = check_image_header(staging_path, current_app.config['IMAGE_MAX_PIXELS'])
+        except InvalidImage as e:
+            os.remove(staging_path)
+            return jsonify({"error": str(e)}), 400
+
+        # mismo contenido = mismo fichero: si ya esta procesada se asigna sin mas
+        filename = f"{digest}.{extension}"
+        if assign_profile_picture(int(current_user_id), filename, require_ready=True):
+            db.session.commit()
+            os.remove(staging_path)
+            return jsonify({
+                "message": "File uploaded successfully",
+                "status": "ready",
+                "filename": filename,
+                "file_path": f"/api/profile/picture/{filename}"
+            }), 200
+
+        try:
+            register_picture(filename)
             db.session.commit()
-            print(f"✅ Database updated with filename: {filename}")
+        except IntegrityError:
+            # la misma foto subida a la vez por otra peticion: ya tiene su fila
+            db.session.rollback()
+        # antes de encolar: si termina antes una subida anterior, ya no se asigna
+        set_pending_picture(int(current_user_id), filename)
+        db.session.commit()
+
+        if not picture_pipeline.submit(int(current_user_id), filename, staging_path):
+            os.remove(staging_path)
+            response = jsonify({"error": "Too many pictures being processed, try again later"})
+            response.headers['Retry-After'] = '5'
+            return response, 503
 
+        # la foto del usuario cambia cuando termina el procesado (ver api/images.py)
         return jsonify({
-            "message": "File uploaded successfully",
+            "message": "File uploaded, processing",
+            "status": "processing",
             "filename": filename,
             "file_path": f"/api/profile/picture/{filename}"
-        }), 200
+        }), 202
     else:
         return jsonify({"error": "File type not allowed. Only PNG, JPG and JPEG files are allowed."}), 400
 
 
 @api.route('/profile/picture/<filename>', methods=['GET'])
 def get_profile_picture(filename):
+    size = request.args.get('size', DEFAULT_PICTURE_SIZE)
+    if size not in PICTURE_SIZES:
+        return jsonify({"error": f"size must be one of: {', '.join(PICTURE_SIZES)}"}), 400
+
+    upload_folder = profile_pictures_folder()
+    webp = 'image/webp' in request.headers.get('Accept', '')
+    variant = picture_index.find(upload_folder, secure_filename(filename), size, webp)
+    if variant is None:
+        return jsonify({"error": "File not found"}), 404
+
     try:
-        # Use the same absolute path as in upload
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        upload_folder = os.path.join(base_dir, 'src', 'front', 'assets', 'img', 'ProfilePictures')
-        
-        # Debug: Check if file exists
-        file_path = os.path.join(upload_folder, filename)
-        print(f"🔍 Looking for file: {file_path}")
-        print(f"🔍 File exists: {os.path.exists(file_path)}")
-        print(f"📁 Upload folder: {upload_folder}")
-        
-        if not os.path.exists(file_path):
-            print(f"❌ File not found: {file_path}")
-            # List files in directory for debugging
-            if os.path.exists(upload_folder):
-                files = os.listdir(upload_folder)
-                print(f"📋 Files in directory: {files}")
-            return jsonify({"error": "File not found"}), 404
-            
-        print(f"✅ Serving file: {file_path}")
-        return send_from_directory(upload_folder, filename)
-    except Exception as e:
-        print(f"❌ Error serving file: {str(e)}")
-        return jsonify({"error": f"Error serving file: {str(e)}"}), 500
+        return serve_picture(upload_folder, variant)
+    except FileNotFoundError:
+        # borrado por flask gc-pictures desde otro proceso
+        picture_index.discard([variant])
+        return jsonify({"error": "File not found"}), 404
 
 
 @api.route('/profile/my-picture', methods=['GET'])
 @jwt_required()
 def get_my_profile_picture():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-
-    if not user:
-        return jsonify({"error": "User not found"}), 404
+    # current_user: proyeccion cacheada del usuario del token (ver api/identity.py)
+    user = current_user
 
     if user.profile_image_url:
         return jsonify({
@@ -151,14 +173,25 @@ def handle_hello():
 
 @api.route('/tags', methods=['GET'])
 def get_tags():
-    all_tags = Tags.query.all()
-    serialized_tags = []
-    for tag in all_tags:
-        serialized_tags.append({
-            "tag_id": tag.tag_id,
-            "name": tag.name
-        })
-    return jsonify(serialized_tags), 200
+    # servido desde el catalogo en memoria; el ETag es la version del catalogo
+    version, tags = tag_catalog.listing()
+    return conditional_response(version, None, lambda: jsonify(tags))
+
+# Endpoint de autocompletado de tags, servido desde el catalogo en memoria
+
+
+@api.route('/tags/suggest', methods=['GET'])
+def suggest_tags():
+    prefix = request.args.get('prefix', '').strip()
+    try:
+        limit = int(request.args.get('limit', DEFAULT_SUGGESTIONS))
+    except ValueError:
+        return jsonify({"msg": "El parámetro limit debe ser un número entero"}), 400
+    limit = max(1, min(limit, MAX_SUGGESTIONS))
+
+    if not prefix:
+        return jsonify([]), 200
+    return jsonify(tag_catalog.suggest(prefix, limit)), 200
 
 # PAULO Endpoint para obtener todas las notas
 
@@ -166,38 +199,92 @@ def get_tags():
 @api.route('/notes', methods=['GET'])
 def get_notes():
     try:
-        all_notes = Notes.query.all()
-        serialized_notes = [note.serialize() for note in all_notes]
-        return jsonify(serialized_notes), 200
+        # validador barato: solo (note_id, version) de las filas de la pagina
+        page_rows, page_cursor = paginate_keyset(
+            db.session.query(Notes.note_id, Notes.created_at, Notes.version),
+            Notes.created_at, Notes.note_id, request.args)
+        etag = make_etag('notes', page_cursor,
+                         *(f"{row.note_id}.{note_etag_version(row.note_id, row.version)}" for row in page_rows))
+
+        def build_page():
+            # ?limit=&cursor= -> paginacion por cursor, nunca toda la tabla;
+            # cargamos exactamente las filas que validamos arriba
+            notes = Notes.query.filter(
+                Notes.note_id.in_([row.note_id for row in page_rows])
+            ).order_by(Notes.created_at.desc(), Notes.note_id.desc()).options(
+                *note_serialize_options()).yield_per(STREAM_BATCH_SIZE)
+            return stream_list_response((note.serialize() for note in notes),
+                                        key="notes", extra={"next_cursor": page_cursor})
+
+        return conditional_response(etag, None, build_page)
+
+    except APIException:
+        raise
 
     except Exception as e:
-        print(f"Error en get_notes: {str(e)}")
+        current_app.logger.exception("Error en get_notes")
         return jsonify({"msg": f"Error interno del servidor: {str(e)}"}), 500
 
 
 @api.route('/notes/search', methods=['GET'])
 def search_notes_by_tag():
-    tag_query = request.args.get('tag', '').strip()
+    # ?q= -> busqueda full-text ranqueada sobre titulo y contenido
+    text_query = request.args.get('q', '').strip()
+    if text_query:
+        results, next_cursor = search_notes(text_query, request.args)
+        return jsonify({"notes": results, "next_cursor": next_cursor}), 200
 
-    # Buscar notas que contengan el tag especificado
-    notes_with_tag = Notes.query.join(Notes.tags).filter(
-        Tags.name.ilike(f'%{tag_query}%')
-    ).distinct().all()
+    tag_query = request.args.get('tag', '').strip()
+    if not tag_query:
+        # un tag vacio coincidiria con todos: seria la tabla de notas entera
+        return jsonify({"msg": "Indica un texto (q) o un tag (tag) para buscar"}), 400
+
+    # Buscar notas con algun tag cuyo nombre (o una de sus palabras) empieza por el texto
+    # los tags que coinciden salen del catalogo en memoria, y las notas con un
+    # semi-join por tag_id (indexado) en lugar de un ILIKE '%q%' sobre tags
+    tag_ids = tag_catalog.matching_ids(tag_query)
+    if not tag_ids:
+        return jsonify({"notes": [], "next_cursor": None}), 200
+
+    query = Notes.query.filter(Notes.note_id.in_(
+        db.select(note_tags.c.note_id).where(note_tags.c.tag_id.in_(tag_ids))
+    )).options(*note_serialize_options())
+    notes_with_tag, next_cursor = paginate_keyset(
+        query, Notes.created_at, Notes.note_id, request.args)
 
     serialized_notes = [note.serialize() for note in notes_with_tag]
-    return jsonify(serialized_notes), 200
+    return jsonify({"notes": serialized_notes, "next_cursor": next_cursor}), 200
 
 # PAULO Endpoint para obtener todos los comentarios de una nota
 
 
 @api.route('/notes/<int:note_id>/comments', methods=['GET'])
 def get_comments(note_id):
-    note = Notes.query.get(note_id)
-    if not note:
+    # la version de la nota cambia con cada comentario creado, editado, borrado o votado
+    validator = db.session.query(Notes.version, Notes.updated_at).filter(
+        Notes.note_id == note_id).first()
+    if not validator:
         return jsonify({"msg": "La nota no existe."}), 404
-    comments_list = [comment.serialize() for comment in note.comments]
 
-    return jsonify(comments_list), 200
+    cursor = request.args.get('cursor')
+    limit = get_page_limit(request.args)
+
+    def build_comments():
+        # mas recientes primero; cada pagina sale del indice (note_id, created_at, comment_id)
+        query = db.session.query(*comment_list_columns()).outerjoin(
+            User, User.id == Comments.user_id).filter(Comments.note_id == note_id)
+        comments, next_cursor = paginate_keyset(
+            query, Comments.created_at, Comments.comment_id, request.args)
+
+        page = {"comments": [serialize_comment_row(row) for row in comments], "next_cursor": next_cursor}
+        if not cursor:
+            page["comments_count"] = db.session.query(db.func.count(Comments.comment_id)).filter(
+                Comments.note_id == note_id).scalar()
+        return jsonify(page)
+
+    return conditional_response(
+        make_etag('comments', note_id, note_etag_version(note_id, validator.version), cursor, limit),
+        note_last_modified(note_id, validator.updated_at), build_comments)
 
 # PAULO Endpoint para crear una nueva nota
 
@@ -208,7 +295,6 @@ def create_note():
     # guardamos el id del user del token en la. variable current_user_ide
     current_user_id = get_jwt_identity()
     body = request.get_json()  # recibimos los datos del front en json
-    print("Datos recibidos del frontend:", body)
 
     required_fields = ['title', 'content', 'tags']  # campos obligatorios
     if not all(field in body for field in required_fields):
@@ -229,15 +315,17 @@ def create_note():
         is_anonymous=is_anonymous,
     )
 
-    try:  # agregamos los tags a la nota
-        for tag_name in tag_names:
-            # buscamos el tag en la db
-            tag = Tags.query.filter_by(name=tag_name).first()
-            if not tag:
-                return jsonify({"msg": f"El tag '{tag_name}' no existe."}), 400
-            new_note.tags.append(tag)  # si existe, lo agregamos a la nota
+    # resolvemos todos los tags de una vez desde el catalogo (a lo sumo un IN)
+    tag_ids, missing_tags = tag_catalog.resolve(tag_names)
+    if missing_tags:
+        return jsonify({"msg": f"El tag '{missing_tags[0]}' no existe."}), 400
 
+    try:  # agregamos los tags a la nota
         db.session.add(new_note)
+        db.session.flush()  # necesitamos el note_id para la tabla intermedia
+        db.session.execute(note_tags.insert(), [
+            {"note_id": new_note.note_id, "tag_id": tag_id} for tag_id in tag_ids
+        ])
         db.session.commit()  # guardamos
     except Exception as e:
         # si hay errores nos vamos a 0 para evitar que la informacion se quede en el aire
@@ -246,10 +334,20 @@ def create_note():
 
     return jsonify(new_note.serialize()), 201
 
+
+# respuesta comun de signup / login cuando el pool de bcrypt esta lleno
+def password_hasher_busy():
+    response = jsonify({"error": "Demasiados inicios de sesión a la vez, intenta de nuevo en unos segundos"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '2'
+    return response
+
+
 # endpoint para crear un nuevo usuario
 
 
 @api.route('/user', methods=['POST'])
+@auth_rate_limited
 def create_user():
 
     data = request.get_json()
@@ -271,7 +369,10 @@ def create_user():
     if User.query.filter_by(username=username).first():
         return jsonify({"error": "El nombre de usuario ya está en uso"}), 400
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    try:
+        hashed_password = password_hasher.hash(password)
+    except PasswordHasherBusy:
+        return password_hasher_busy()
 
     new_user = User(
         email=email,
@@ -295,6 +396,7 @@ def create_user():
 
 
 @api.route('/token', methods=['POST'])
+@auth_rate_limited
 def create_token():
 
     email = request.json.get("email", None)
@@ -302,12 +404,21 @@ def create_token():
 
     user = User.query.filter_by(email=email).first()
 
-    if user is None:
+    if user is None or not password:
         return jsonify({"error": "Email o contraseña invalida"}), 401
 
-    if not bcrypt.check_password_hash(user.password_hash, password):
+    try:
+        valid, new_hash = password_hasher.verify(user.password_hash, password)
+    except PasswordHasherBusy:
+        return password_hasher_busy()
+    if not valid:
         return jsonify({"error": "Email o contraseña invalida"}), 401
 
+    if new_hash is not None:
+        # BCRYPT_LOG_ROUNDS cambio desde que se guardo: se actualiza con el coste nuevo
+        user.password_hash = new_hash
+        db.session.commit()
+
     access_token = create_access_token(identity=str(user.id))
     return jsonify(access_token=access_token)
 
@@ -316,11 +427,10 @@ def create_token():
 
 @api.route('/users', methods=['GET'])
 def get_all_users():
-    all_users = User.query.all()
-    if not all_users:
+    if db.session.query(User.id).first() is None:
         return jsonify({"msg": "No se encontraron usuarios"}), 404
-    serialized_users = [user.serialize() for user in all_users]
-    return jsonify(serialized_users), 200
+    all_users = User.query.order_by(User.id).yield_per(STREAM_BATCH_SIZE)
+    return stream_list_response(user.serialize() for user in all_users)
 
 # PAULO Endpoint para crear un nuevo comentario en una nota
 
@@ -342,7 +452,11 @@ def create_comment(note_id):
         note_id=note_id
     )
     db.session.add(new_comment)  # nos preparamos par aguardar lo que recibimos
+    touch_note(note_id)
     try:
+        db.session.flush()  # necesitamos el comment_id para la notificacion
+        notify_note_owner('comment', note_id, current_user_id, new_comment.comment_id)
+        announce('note', note_id, new_comment.comment_id)
         db.session.commit()  # guardamos
         return jsonify(new_comment.serialize()), 201
     except Exception as e:
@@ -355,26 +469,36 @@ def create_comment(note_id):
 @api.route('/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(int(current_user_id))
+    current_user_id = current_user.id
+    # el validador siempre de la db: la cache de current_user puede ir unos segundos por detras
+    updated_at = db.session.query(User.updated_at).filter(
+        User.id == current_user_id).scalar()
 
-    if user is None:
+    if updated_at is None:
         return jsonify({"error": "Usuario no encontrado"}), 404
 
-    profile_picture_url = None
-    if user.profile_image_url:
-        profile_picture_url = f"/api/profile/picture/{user.profile_image_url}"
+    def build_profile():
+        user = current_user
+        if user.updated_at != updated_at:
+            user = load_user_identity(current_user_id, refresh=True)
 
-    return jsonify({
-        "id": user.id,
-        "username": user.username,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "email": user.email,
-        "bio": user.bio or "",
-        "profile_picture_url": profile_picture_url,
-        "has_profile_picture": bool(user.profile_image_url)
-    })
+        profile_picture_url = None
+        if user.profile_image_url:
+            profile_picture_url = f"/api/profile/picture/{user.profile_image_url}"
+
+        return jsonify({
+            "id": user.id,
+            "username": user.username,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "email": user.email,
+            "bio": user.bio or "",
+            "profile_picture_url": profile_picture_url,
+            "has_profile_picture": bool(user.profile_image_url)
+        })
+
+    return conditional_response(
+        make_etag('profile', current_user_id, updated_at.isoformat()), updated_at, build_profile)
 
 # MAIN NUEVO ENDPOINT: Obtener notas del usuario actual
 
@@ -384,7 +508,10 @@ def get_profile():
 def get_user_notes():
     try:
         current_user_id = get_jwt_identity()
-        user_notes = Notes.query.filter_by(user_id=current_user_id).all()
+        user_notes, next_cursor = paginate_keyset(
+            Notes.query.filter_by(user_id=current_user_id).options(
+                selectinload(Notes.tags)),
+            Notes.created_at, Notes.note_id, request.args)
 
         serialized_notes = []
         for note in user_notes:
@@ -396,38 +523,62 @@ def get_user_notes():
                 "tags": [tag.name for tag in note.tags]
             })
 
-        return jsonify(serialized_notes), 200
+        page = {"notes": serialized_notes, "next_cursor": next_cursor}
+        if not request.args.get('cursor'):
+            # total para el contador del perfil, solo en la primera pagina (sale del indice por user_id)
+            page["notes_count"] = db.session.query(db.func.count(Notes.note_id)).filter(
+                Notes.user_id == current_user_id).scalar()
+        return jsonify(page), 200
 
+    except APIException:
+        raise
     except Exception as e:
         return jsonify({"msg": f"Error: {str(e)}"}), 500
 
+# Stream SSE con los comentarios nuevos de una nota (reanuda con Last-Event-ID)
+
+
+@api.route('/notes/<int:note_id>/events', methods=['GET'])
+def note_events(note_id):
+    if db.session.query(Notes.note_id).filter(Notes.note_id == note_id).first() is None:
+        return jsonify({"msg": "Nota no encontrada"}), 404
+    return stream_events('note', note_id)
+
 # Endpoint para obtener una nota por ID
 
 
 @api.route('/notes/<int:note_id>', methods=['GET'])
 def get_note_by_id(note_id):
-    note = Notes.query.get(note_id)
-    if not note:
+    validator = db.session.query(Notes.version, Notes.updated_at).filter(
+        Notes.note_id == note_id).first()
+    if not validator:
         return jsonify({"msg": "Nota no encontrada"}), 404
 
-    user = User.query.get(note.user_id)
-    user_info = None
-    if user:
-        user_info = {
-            "username": user.username,
+    def build_note():
+        note = Notes.query.get(note_id)
+
+        username = db.session.query(User.username).filter(User.id == note.user_id).scalar()
+        user_info = None
+        if username is not None:
+            user_info = {
+                "username": username,
+            }
+
+        serialized_note = {
+            "note_id": note.note_id,
+            "title": note.title,
+            "content": note.content,
+            "user_id": note.user_id,
+            "is_anonymous": note.is_anonymous,
+            "user_info": user_info,  # lo agregamos al resultado serializado
+            **vote_counts('note', note.note_id, note.positive_votes, note.negative_votes),
+            "tags": [{"tag_id": tag.tag_id, "name": tag.name} for tag in note.tags]
         }
+        return jsonify(serialized_note)
 
-    serialized_note = {
-        "note_id": note.note_id,
-        "title": note.title,
-        "content": note.content,
-        "user_id": note.user_id,
-        "is_anonymous": note.is_anonymous,
-        "user_info": user_info,  # lo agregamos al resultado serializado
-        "tags": [{"tag_id": tag.tag_id, "name": tag.name} for tag in note.tags]
-    }
-
-    return jsonify(serialized_note), 200
+    return conditional_response(
+        make_etag('note', note_id, note_etag_version(note_id, validator.version)),
+        note_last_modified(note_id, validator.updated_at), build_note)
 
 # Endpoint para actualizar la bio del usuario
 
@@ -435,8 +586,8 @@ def get_note_by_id(note_id):
 @api.route('/profile/bio', methods=['PUT'])
 @jwt_required()
 def update_user_bio():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    # entidad completa para escribirla; el commit invalida la cache de current_user
+    user = db.session.get(User, current_user.id)
 
     data = request.get_json()
     bio = data.get('bio', '')
@@ -450,30 +601,11 @@ def update_user_bio():
 @api.route('/profile/remove-picture', methods=['DELETE'])
 @jwt_required()
 def remove_profile_picture():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-
-    if not user:
-        return jsonify({"error": "Usuario no encontrado"}), 404
-
-    if not user.profile_image_url:
+    if not current_user.profile_image_url:
         return jsonify({"error": "No hay foto de perfil para eliminar"}), 400
 
-    # Optional: Delete the physical file from the server
-    try:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        upload_folder = os.path.join(base_dir, 'src', 'front', 'assets', 'img', 'ProfilePictures')
-        file_path = os.path.join(upload_folder, user.profile_image_url)
-        
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"✅ Physical file deleted: {file_path}")
-    except Exception as e:
-        print(f"⚠️ Could not delete physical file: {str(e)}")
-        # Continue anyway, as the main goal is to remove from database
-
-    # Remove from database
-    user.profile_image_url = None
+    # los ficheros pueden ser de mas usuarios: los borra flask gc-pictures cuando nadie los usa
+    assign_profile_picture(current_user.id, None)
     db.session.commit()
 
     return jsonify({"message": "Foto de perfil eliminada exitosamente"}), 200
@@ -500,6 +632,7 @@ def update_comment(comment_id):
 
     comment.content = new_content
     comment.updated_at = datetime.datetime.utcnow()
+    touch_note(comment.note_id)
 
     try:
         db.session.commit()
@@ -530,6 +663,7 @@ def delete_comment(comment_id):
         return jsonify({"msg": "No tienes permiso para eliminar este comentario."}), 403
 
     try:
+        touch_note(comment.note_id)
         db.session.delete(comment)
         db.session.commit()
         return jsonify({"msg": "Comentario eliminado exitosamente."}), 200
@@ -562,6 +696,59 @@ def delete_note(note_id):
         db.session.rollback()
         return jsonify({"msg": f"Ocurrió un error inesperado: {str(e)}"}), 500
 
+def commit_vote_change(note_id, comment_id, old_type, new_type):
+    """
+    Confirma el cambio de voto ya hecho en la sesion junto con el ajuste de
+    positive_votes / negative_votes. old_type None = voto nuevo, new_type None =
+    voto borrado. En modo write-behind el contador se ajusta despues del commit
+    a traves de vote_buffer (ver api/vote_buffer.py).
+    """
+    kind, target_id = ('note', note_id) if note_id else ('comment', comment_id)
+    positive_delta = (new_type == 1) - (old_type == 1)
+    negative_delta = (new_type == -1) - (old_type == -1)
+
+    if vote_buffer.enabled:
+        # la nota del comentario: sus ETag tienen que cambiar ya (ver note_etag_version)
+        owner_note_id = note_id or db.session.scalar(
+            db.select(Comments.note_id).where(Comments.comment_id == comment_id))
+        db.session.commit()
+        vote_buffer.record(kind, int(target_id), positive_delta, negative_delta, int(owner_note_id))
+        return
+
+    apply_vote_deltas(kind, target_id, positive_delta, negative_delta)
+    db.session.commit()
+
+def upsert_vote(user_id, note_id, comment_id, vote_type):
+    """
+    Registra o invierte un voto con un unico INSERT ... ON CONFLICT DO UPDATE
+    sobre los indices unicos parciales de votes (Postgres y SQLite).
+    Devuelve "added", "updated" o None si ya existia un voto del mismo tipo.
+    """
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+
+    if note_id:
+        conflict_columns, conflict_where = ['user_id', 'note_id'], Votes.note_id.isnot(None)
+    else:
+        conflict_columns, conflict_where = ['user_id', 'comment_id'], Votes.comment_id.isnot(None)
+
+    statement = insert(Votes).values(
+        user_id=user_id, note_id=note_id, comment_id=comment_id, vote_type=vote_type)
+    statement = statement.on_conflict_do_update(
+        index_elements=conflict_columns,
+        index_where=conflict_where,
+        set_={"vote_type": statement.excluded.vote_type,
+              "updated_at": datetime.datetime.utcnow()},
+        # mismo tipo de voto -> no se actualiza nada y RETURNING no devuelve fila
+        where=Votes.vote_type != statement.excluded.vote_type
+    ).returning(Votes.updated_at)
+
+    row = db.session.execute(statement).first()
+    if row is None:
+        return None
+    # updated_at solo lo escribe la rama DO UPDATE, asi distinguimos alta de cambio
+    return "added" if row.updated_at is None else "updated"
+
 # NUEVO ENDPOINT: Para votar en notas y comentarios
 
 
@@ -582,66 +769,109 @@ def create_vote():
     if vote_type not in [1, -1]:
         return jsonify({"msg": "Tipo de voto inválido"}), 400
 
-    # Buscar si ya existe un voto de este usuario
-    if note_id:
-        existing_vote = Votes.query.filter_by(
-            user_id=current_user_id,
-            note_id=note_id
-        ).first()
-    else:
-        existing_vote = Votes.query.filter_by(
-            user_id=current_user_id,
-            comment_id=comment_id
-        ).first()
+    action = upsert_vote(int(current_user_id), note_id, comment_id, vote_type)
+    if action is None:
+        # el ON CONFLICT no actualizo nada: ya existia un voto del mismo tipo
+        db.session.rollback()
+        return jsonify({"msg": "Ya has votado de esta forma"}), 400
 
-    if existing_vote:
-        # Si el voto es del mismo tipo, no permitimos votar de nuevo
-        if existing_vote.vote_type == vote_type:
-            return jsonify({"msg": "Ya has votado de esta forma"}), 400
-        else:
-            # Si es diferente tipo, lo actualizamos
-            existing_vote.vote_type = vote_type
-            db.session.commit()
-            return jsonify({"msg": "Voto actualizado", "action": "updated"}), 200
-    else:
-        # Crear nuevo voto
-        new_vote = Votes(
-            user_id=current_user_id,
-            note_id=note_id,
-            comment_id=comment_id,
-            vote_type=vote_type
-        )
-        db.session.add(new_vote)
-        db.session.commit()
+    if note_id and action == "added":
+        notify_note_owner('vote', note_id, current_user_id)
+    commit_vote_change(note_id, comment_id,
+                       None if action == "added" else -vote_type, vote_type)
+    if action == "added":
         return jsonify({"msg": "Voto registrado", "action": "added"}), 201
+    return jsonify({"msg": "Voto actualizado", "action": "updated"}), 200
+
+# NUEVO ENDPOINT: Retirar el voto del usuario en una nota o comentario
+
+
+@api.route('/vote', methods=['DELETE'])
+@jwt_required()
+def delete_vote():
+    current_user_id = get_jwt_identity()
+    body = request.get_json()
+
+    note_id = body.get('note_id')
+    comment_id = body.get('comment_id')
+
+    if not ((note_id and not comment_id) or (comment_id and not note_id)):
+        return jsonify({"msg": "Debes indicar una nota o un comentario, no ambos"}), 400
+
+    # DELETE ... RETURNING: borramos y sabemos que tipo de voto era en un solo paso
+    target = Votes.note_id == note_id if note_id else Votes.comment_id == comment_id
+    deleted_type = db.session.execute(
+        db.delete(Votes).where(Votes.user_id == int(current_user_id), target)
+        .returning(Votes.vote_type)
+    ).scalar()
+
+    if deleted_type is None:
+        db.session.rollback()
+        return jsonify({"msg": "No has votado en este elemento"}), 404
+
+    commit_vote_change(note_id, comment_id, deleted_type, None)
+    return jsonify({"msg": "Voto eliminado", "action": "removed"}), 200
 
 # NUEVO ENDPOINT: Obtener conteo de votos para un elemento
 
 
 @api.route('/votes/count', methods=['GET'])
 def get_votes_count():
-    note_id = request.args.get('note_id')
-    comment_id = request.args.get('comment_id')
+    note_id = parse_id(request.args, 'note_id')
+    comment_id = parse_id(request.args, 'comment_id')
 
     if not note_id and not comment_id:
         return jsonify({"msg": "Se requiere note_id o comment_id"}), 400
 
+    # los contadores viven en la propia fila, no hace falta tocar la tabla votes
     if note_id:
-        positive_votes = Votes.query.filter_by(
-            note_id=note_id, vote_type=1).count()
-        negative_votes = Votes.query.filter_by(
-            note_id=note_id, vote_type=-1).count()
+        kind, target_id = 'note', note_id
+        counts = db.session.query(Notes.positive_votes, Notes.negative_votes).filter(
+            Notes.note_id == note_id).first()
     else:
-        positive_votes = Votes.query.filter_by(
-            comment_id=comment_id, vote_type=1).count()
-        negative_votes = Votes.query.filter_by(
-            comment_id=comment_id, vote_type=-1).count()
-
-    return jsonify({
-        "positive_votes": positive_votes,
-        "negative_votes": negative_votes,
-        "total_votes": positive_votes - negative_votes
-    }), 200
+        kind, target_id = 'comment', comment_id
+        counts = db.session.query(Comments.positive_votes, Comments.negative_votes).filter(
+            Comments.comment_id == comment_id).first()
+
+    # suma los votos del modo write-behind que aun no se volcaron a la db
+    counts = vote_counts(kind, target_id, *(counts if counts else (0, 0)))
+    counts["total_votes"] = counts["positive_votes"] - counts["negative_votes"]
+    return jsonify(counts), 200
+
+# Endpoint batch: conteos de votos de muchas notas y comentarios en una sola query
+
+
+@api.route('/votes/counts', methods=['GET'])
+def get_votes_counts():
+    note_ids = parse_id_list(request.args, 'note_ids')
+    comment_ids = parse_id_list(request.args, 'comment_ids')
+
+    if not note_ids and not comment_ids:
+        return jsonify({"msg": "Se requiere note_ids o comment_ids"}), 400
+    if len(note_ids) + len(comment_ids) > MAX_BATCH_IDS:
+        return jsonify({"msg": f"Máximo {MAX_BATCH_IDS} ids por llamada"}), 400
+
+    # los contadores estan desnormalizados en notes/comments, asi que basta con
+    # leerlos: un UNION ALL de las dos tablas resuelve todo en un round trip
+    selects = []
+    if note_ids:
+        selects.append(db.select(
+            db.literal('note').label('kind'), Notes.note_id.label('id'),
+            Notes.positive_votes, Notes.negative_votes
+        ).where(Notes.note_id.in_(note_ids)))
+    if comment_ids:
+        selects.append(db.select(
+            db.literal('comment').label('kind'), Comments.comment_id.label('id'),
+            Comments.positive_votes, Comments.negative_votes
+        ).where(Comments.comment_id.in_(comment_ids)))
+    query = selects[0] if len(selects) == 1 else db.union_all(*selects)
+
+    counts = {"notes": {}, "comments": {}}
+    for kind, target_id, positive_votes, negative_votes in db.session.execute(query):
+        target_counts = vote_counts(kind, target_id, positive_votes, negative_votes)
+        target_counts["total_votes"] = target_counts["positive_votes"] - target_counts["negative_votes"]
+        counts[kind + "s"][str(target_id)] = target_counts
+    return jsonify(counts), 200
 
 # NUEVO ENDPOINT: Obtener el voto del usuario actual
 
@@ -650,8 +880,8 @@ def get_votes_count():
 @jwt_required()
 def get_my_vote():
     current_user_id = get_jwt_identity()
-    note_id = request.args.get('note_id')
-    comment_id = request.args.get('comment_id')
+    note_id = parse_id(request.args, 'note_id')
+    comment_id = parse_id(request.args, 'comment_id')
 
     if not note_id and not comment_id:
         return jsonify({"msg": "Se requiere note_id o comment_id"}), 400
@@ -674,6 +904,51 @@ def get_my_vote():
     
 
 
+# Endpoint batch: votos y favoritos del usuario actual para una pagina de notas/comentarios
+
+
+@api.route('/my-state', methods=['GET'])
+@jwt_required()
+def get_my_state():
+    current_user_id = int(get_jwt_identity())
+    note_ids = parse_id_list(request.args, 'note_ids')
+    comment_ids = parse_id_list(request.args, 'comment_ids')
+
+    if not note_ids and not comment_ids:
+        return jsonify({"msg": "Se requiere note_ids o comment_ids"}), 400
+    if len(note_ids) + len(comment_ids) > MAX_BATCH_IDS:
+        return jsonify({"msg": f"Máximo {MAX_BATCH_IDS} ids por llamada"}), 400
+
+    state = {
+        "notes": {str(note_id): {"vote_type": 0, "is_favorite": False} for note_id in note_ids},
+        "comments": {str(comment_id): {"vote_type": 0} for comment_id in comment_ids}
+    }
+
+    # una query sobre votes (indices user_id + note_id / comment_id)
+    targets = []
+    if note_ids:
+        targets.append(Votes.note_id.in_(note_ids))
+    if comment_ids:
+        targets.append(Votes.comment_id.in_(comment_ids))
+    votes = db.session.query(Votes.note_id, Votes.comment_id, Votes.vote_type).filter(
+        Votes.user_id == current_user_id, db.or_(*targets)).all()
+    for note_id, comment_id, vote_type in votes:
+        if note_id is not None:
+            state["notes"][str(note_id)]["vote_type"] = vote_type
+        else:
+            state["comments"][str(comment_id)]["vote_type"] = vote_type
+
+    # y otra sobre la clave primaria (user_id, note_id) de favoritos
+    if note_ids:
+        favorite_ids = db.session.query(UserNoteFavorites.note_id).filter(
+            UserNoteFavorites.user_id == current_user_id,
+            UserNoteFavorites.note_id.in_(note_ids)).all()
+        for (note_id,) in favorite_ids:
+            state["notes"][str(note_id)]["is_favorite"] = True
+
+    return jsonify(state), 200
+
+
  #----------------------- rutas para lista de favoritos
 
 # Agregar nota a favoritos
@@ -691,6 +966,8 @@ def add_favorite(note_id):
 
     new_fav = UserNoteFavorites(user_id=current_user_id, note_id=note_id)
     db.session.add(new_fav)
+    touch_note(note_id)
+    notify_note_owner('favorite', note_id, current_user_id)
     try:
         db.session.commit()
         return jsonify({"msg": "Nota agregada a favoritos"}), 201
@@ -709,6 +986,7 @@ def remove_favorite(note_id):
         return jsonify({"msg": "Nota no está en favoritos"}), 404
 
     db.session.delete(favorite)
+    touch_note(note_id)
     try:
         db.session.commit()
         return jsonify({"msg": "Nota removida de favoritos"}), 200
@@ -721,15 +999,103 @@ def remove_favorite(note_id):
 @jwt_required()
 def get_favorites():
     current_user_id = get_jwt_identity()
-    favorites = UserNoteFavorites.query.filter_by(user_id=current_user_id).all()
+    # una sola query para las notas + cargas agrupadas de sus relaciones
+    favorite_notes = Notes.query.join(
+        UserNoteFavorites, UserNoteFavorites.note_id == Notes.note_id
+    ).filter(
+        UserNoteFavorites.user_id == current_user_id
+    ).order_by(UserNoteFavorites.created_at).options(
+        *note_serialize_options()).yield_per(STREAM_BATCH_SIZE)
+
+    return stream_list_response(note.serialize() for note in favorite_notes)
+
+# Bandeja de notificaciones del usuario actual, paginada por cursor (?unread=1 solo sin leer)
+
+
+@api.route('/notifications', methods=['GET'])
+@jwt_required()
+def get_notifications():
+    current_user_id = int(get_jwt_identity())
+    query = Notifications.query.filter_by(recipient_user_id=current_user_id).options(
+        joinedload(Notifications.actor), joinedload(Notifications.note))
+    if request.args.get('unread') == '1':
+        query = query.filter(Notifications.is_read.is_(False))
+
+    notifications, next_cursor = paginate_keyset(
+        query, Notifications.created_at, Notifications.notification_id, request.args)
+    return jsonify({
+        "notifications": [notification.serialize() for notification in notifications],
+        "next_cursor": next_cursor
+    }), 200
+
+# Token corto para abrir el stream de notificaciones: EventSource no puede mandar
+# cabeceras y el token de sesion no debe ir en la URL
+
+
+@api.route('/notifications/events/token', methods=['POST'])
+@jwt_required()
+def notification_events_token():
+    return jsonify({"token": create_stream_token(get_jwt_identity())}), 200
+
+# Stream SSE de las notificaciones del usuario actual, con ?jwt=<token de stream>
+
+
+@api.route('/notifications/events', methods=['GET'])
+@stream_token_required
+def notification_events():
+    return stream_events('user', int(get_jwt_identity()))
+
+# Contador de notificaciones sin leer: lee User.unread_notifications, no cuenta filas
 
-    notes = []
-    for fav in favorites:
-        note = Notes.query.get(fav.note_id)
-        if note:
-            notes.append(note.serialize())
 
-    return jsonify(notes), 200
+@api.route('/notifications/unread-count', methods=['GET'])
+@jwt_required()
+def get_unread_notifications_count():
+    current_user_id = int(get_jwt_identity())
+    unread = db.session.query(User.unread_notifications).filter(
+        User.id == current_user_id).scalar()
+    if unread is None:
+        return jsonify({"msg": "Usuario no encontrado"}), 404
+    return jsonify({"unread_count": unread}), 200
+
+# Marca como leidas varias notificaciones ({"notification_ids": [...]}) o todas ({"all": true})
+
+
+@api.route('/notifications/read', methods=['POST'])
+@jwt_required()
+def mark_notifications_read():
+    current_user_id = int(get_jwt_identity())
+    body = request.get_json() or {}
+    notification_ids = body.get('notification_ids')
+    mark_all = body.get('all') is True
+
+    conditions = [Notifications.recipient_user_id == current_user_id,
+                  Notifications.is_read.is_(False)]
+    if not mark_all:
+        if not isinstance(notification_ids, list) or not notification_ids:
+            return jsonify({"msg": "Se requiere notification_ids o all"}), 400
+        if len(notification_ids) > MAX_BATCH_IDS:
+            return jsonify({"msg": f"Máximo {MAX_BATCH_IDS} ids por llamada"}), 400
+        # bool es subclase de int: true / false no son ids
+        if not all(isinstance(notification_id, int) and not isinstance(notification_id, bool)
+                   for notification_id in notification_ids):
+            return jsonify({"msg": "notification_ids debe ser una lista de enteros"}), 400
+        conditions.append(Notifications.notification_id.in_(notification_ids))
+
+    # is_read = false en el WHERE: solo se descuentan las que pasan a leidas en esta llamada
+    marked = db.session.execute(
+        db.update(Notifications).where(*conditions).values(is_read=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    unread = db.session.execute(
+        db.update(User).where(User.id == current_user_id).values(
+            unread_notifications=User.unread_notifications - marked,
+            updated_at=User.updated_at
+        ).returning(User.unread_notifications)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    db.session.commit()
+    return jsonify({"marked": marked, "unread_count": unread}), 200
 
 
     #------------------ api de google
@@ -740,7 +1106,8 @@ def google_login():
     token = data.get("token")
 
     try:
-        idinfo = id_token.verify_oauth2_token(token, google_requests.Request(), "413075624594-02qpect45v5o3uarjnkr42ldob11s4lk.apps.googleusercontent.com")
+        # claves de Google cacheadas segun su Cache-Control (ver api/google_certs.py)
+        idinfo = verify_google_id_token(token, current_app.config['GOOGLE_CLIENT_ID'])
         email = idinfo['email']
         first_name = idinfo.get('given_name', '')
         last_name = idinfo.get('family_name', '')
@@ -762,5 +1129,10 @@ def google_login():
         access_token = create_access_token(identity=str(user.id))
         return jsonify(access_token=access_token), 200
 
+    except GoogleCertsUnavailable:
+        response = jsonify({"error": "No se pudo verificar el token con Google, intenta de nuevo"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
     except ValueError:
         return jsonify({"error": "Token inválido"}), 400
\ No newline at end of file
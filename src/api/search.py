@@ -0,0 +1,182 @@
+"""
+Busqueda full-text sobre titulo y contenido de las notas.
+
+- Postgres (produccion): indice GIN sobre note_search_document() (ver models.py),
+  ranking con ts_rank y fragmentos resaltados con ts_headline. Postgres mantiene
+  el indice solo al insertar/borrar notas.
+- SQLite (local): tabla virtual FTS5 notes_fts con rowid = note_id, ranking bm25
+  y snippet(). La mantienen los eventos de Notes definidos abajo. La tabla se
+  crea (y se rellena con las notas que falten) una vez por proceso; solo cuenta
+  como hecho cuando la transaccion que la creo se confirma.
+"""
+from sqlalchemy import event, func, text
+from sqlalchemy.orm import Session, object_session
+from api.models import db, Notes, SEARCH_CONFIG, note_search_document, note_serialize_options
+from api.utils import APIException, get_page_limit
+
+# limite de resultados navegables, evita OFFSETs enormes en busquedas ranqueadas
+MAX_SEARCH_RESULTS = 1000
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+
+_sqlite_index_ready = False
+
+
+def _ensure_sqlite_index():
+    # busquedas: en una transaccion propia, la sesion de un GET nunca hace commit
+    global _sqlite_index_ready
+    if _sqlite_index_ready:
+        return
+    with db.engine.begin() as connection:
+        sync_search_index(connection)
+    _sqlite_index_ready = True
+
+
+def _ensure_sqlite_index_in_flush(connection, note):
+    # eventos de Notes: dentro de la transaccion del flush; si acaba en rollback se repite
+    if not _sqlite_index_ready:
+        sync_search_index(connection)
+        object_session(note).info['sqlite_index_synced'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _mark_sqlite_index_ready(session):
+    global _sqlite_index_ready
+    if session.info.pop('sqlite_index_synced', False):
+        _sqlite_index_ready = True
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_sqlite_index_sync(session):
+    session.info.pop('sqlite_index_synced', None)
+
+
+def sync_search_index(connection):
+    """
+    Indexa en FTS5 las notas que no pasaron por el ORM (p.ej. inserts masivos de
+    flask import-notes). En Postgres no hace nada: el indice GIN se mantiene solo.
+    """
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts "
+        "USING fts5(title, content, tokenize='unicode61 remove_diacritics 2')"
+    ))
+    connection.execute(text(
+        "INSERT INTO notes_fts(rowid, title, content) "
+        "SELECT note_id, title, content FROM notes "
+        "WHERE note_id NOT IN (SELECT rowid FROM notes_fts)"
+    ))
+
+
+@event.listens_for(Notes, 'after_insert')
+def _index_note(mapper, connection, note):
+    if connection.dialect.name != 'sqlite':
+        return
+    _ensure_sqlite_index_in_flush(connection, note)
+    connection.execute(text(
+        "INSERT OR REPLACE INTO notes_fts(rowid, title, content) VALUES (:id, :title, :content)"
+    ), {"id": note.note_id, "title": note.title, "content": note.content})
+
+
+@event.listens_for(Notes, 'after_update')
+def _reindex_note(mapper, connection, note):
+    if connection.dialect.name != 'sqlite':
+        return
+    _ensure_sqlite_index_in_flush(connection, note)
+    connection.execute(text(
+        "UPDATE notes_fts SET title = :title, content = :content WHERE rowid = :id"
+    ), {"id": note.note_id, "title": note.title, "content": note.content})
+
+
+@event.listens_for(Notes, 'after_delete')
+def _unindex_note(mapper, connection, note):
+    if connection.dialect.name != 'sqlite':
+        return
+    _ensure_sqlite_index_in_flush(connection, note)
+    connection.execute(text("DELETE FROM notes_fts WHERE rowid = :id"), {"id": note.note_id})
+
+
+def _get_offset(args):
+    # el cursor de la busqueda es el offset dentro del ranking
+    cursor = args.get('cursor')
+    if not cursor:
+        return 0
+    try:
+        offset = int(cursor)
+    except ValueError:
+        raise APIException("Cursor inválido", 400)
+    if offset < 0 or offset >= MAX_SEARCH_RESULTS:
+        raise APIException("Cursor inválido", 400)
+    return offset
+
+
+def _fts5_match_expression(query):
+    # cada palabra como frase literal para que la sintaxis de FTS5 no rompa la query
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    return " ".join(terms)
+
+
+def _search_postgres(query, offset, limit):
+    ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+    document = note_search_document()
+    rank = func.ts_rank(document, ts_query)
+    snippet = func.ts_headline(
+        SEARCH_CONFIG, Notes.content, ts_query,
+        f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxFragments=2, MaxWords=20, MinWords=5"
+    )
+    rows = db.session.query(Notes.note_id, rank, snippet).filter(
+        document.op('@@')(ts_query)
+    ).order_by(rank.desc(), Notes.note_id.desc()).offset(offset).limit(limit + 1).all()
+    return [(row[0], float(row[1]), row[2]) for row in rows]
+
+
+def _search_sqlite(query, offset, limit):
+    _ensure_sqlite_index()
+    rows = db.session.execute(text(
+        "SELECT rowid, bm25(notes_fts, 2.0, 1.0) AS rank, "
+        "snippet(notes_fts, 1, :start, :stop, '…', 20) "
+        "FROM notes_fts WHERE notes_fts MATCH :match "
+        "ORDER BY rank, rowid DESC LIMIT :limit OFFSET :offset"
+    ), {
+        "start": HIGHLIGHT_START, "stop": HIGHLIGHT_STOP,
+        "match": _fts5_match_expression(query), "limit": limit + 1, "offset": offset
+    }).all()
+    # bm25 es menor cuanto mejor, lo invertimos para que rank crezca con la relevancia
+    return [(row[0], -row[1], row[2]) for row in rows]
+
+
+def search_notes(query, args):
+    """
+    Devuelve (notas serializadas con "rank" y "snippet", next_cursor) para ?q=.
+    """
+    limit = get_page_limit(args)
+    offset = _get_offset(args)
+    limit = min(limit, MAX_SEARCH_RESULTS - offset)
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        hits = _search_postgres(query, offset, limit)
+    else:
+        hits = _search_sqlite(query, offset, limit)
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        if offset + limit < MAX_SEARCH_RESULTS:
+            next_cursor = str(offset + limit)
+
+    note_ids = [note_id for note_id, _, _ in hits]
+    notes = Notes.query.filter(Notes.note_id.in_(note_ids)).options(
+        *note_serialize_options()).all() if note_ids else []
+    notes_by_id = {note.note_id: note for note in notes}
+
+    results = []
+    for note_id, rank, snippet in hits:
+        note = notes_by_id.get(note_id)
+        if note is None:
+            continue
+        serialized = note.serialize()
+        serialized["rank"] = rank
+        serialized["snippet"] = snippet
+        results.append(serialized)
+    return results, next_cursor
@@ -0,0 +1,151 @@
+"""
+Ficheros del frontend compilado (dist/ de vite) servidos desde un manifiesto
+en memoria que se construye al arrancar: ni os.path.isfile ni listados de
+directorio por peticion.
+
+- Los ficheros que genera vite en assets/ llevan el hash en el nombre
+  (assets/index-3f9a1c2b.js) y no cambian nunca: Cache-Control public, max-age
+  un año, immutable. Lo que se copia tal cual de public/ puede tener un nombre
+  que parezca un hash, asi que fuera de assets/ no se marca nada immutable.
+- index.html (y cualquier ruta desconocida, que es de React Router) y el resto
+  de ficheros se revalidan siempre con su ETag: no-cache.
+- Si existe un .br / .gz hermano y el cliente lo acepta se sirve ese, con su
+  propio ETag y Vary: Accept-Encoding. flask compress-static los genera
+  despues de npm run build (ver render_build.sh).
+- El cuerpo sale con send_file, que gunicorn entrega por wsgi.file_wrapper
+  (sendfile) sin pasar el fichero por Python.
+
+Un build nuevo de dist/ necesita reiniciar la app (como cualquier deploy).
+"""
+import gzip
+import mimetypes
+import os
+import re
+from flask import request, jsonify, send_file
+
+try:
+    import brotli
+except ImportError:  # sin brotli solo se sirven (y generan) los .gz
+    brotli = None
+
+INDEX_FILE = 'index.html'
+# build.assetsDir de vite: el unico sitio donde los nombres llevan hash
+ASSETS_DIR = 'assets/'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# vite añade "-<hash>" de 8 caracteres base64url antes de la extension
+FINGERPRINT_PATTERN = re.compile(r'-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$')
+# extension del hermano precomprimido por Content-Encoding, en orden de preferencia
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_EXTENSIONS = {'.html', '.js', '.mjs', '.css', '.svg', '.json', '.map', '.txt', '.ico', '.webmanifest'}
+PRECOMPRESS_MIN_SIZE = 1024
+
+
+class StaticFile:
+    def __init__(self, path, relative, stat):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.immutable = (relative.startswith(ASSETS_DIR)
+                          and FINGERPRINT_PATTERN.search(os.path.basename(path)) is not None)
+        self.etag = f"{int(stat.st_mtime_ns)}-{stat.st_size}"
+        self.last_modified = stat.st_mtime
+        # Content-Encoding -> (ruta, etag) del hermano precomprimido
+        self.encodings = {}
+
+
+def build_manifest(root):
+    """
+    {ruta relativa con "/": StaticFile} de todos los ficheros de root. Los .br y
+    .gz no son entradas propias sino variantes del fichero al que acompañan.
+    """
+    manifest = {}
+    siblings = []
+    for directory, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            stat = os.stat(path)
+            if name.endswith(tuple(suffix for _, suffix in PRECOMPRESSED)):
+                siblings.append((relative, path, stat))
+            else:
+                manifest[relative] = StaticFile(path, relative, stat)
+
+    for relative, path, stat in siblings:
+        for encoding, suffix in PRECOMPRESSED:
+            original = manifest.get(relative[:-len(suffix)]) if relative.endswith(suffix) else None
+            # un hermano mas viejo que el original es de un build anterior
+            if original is not None and stat.st_mtime >= original.last_modified:
+                original.encodings[encoding] = (path, f"{original.etag}-{encoding}")
+    return manifest
+
+
+def precompress(root, min_size=PRECOMPRESS_MIN_SIZE):
+    # genera los .gz (y .br si esta brotli) de los ficheros de texto; devuelve cuantos escribio
+    written = 0
+    for directory, _, filenames in os.walk(root):
+        for name in filenames:
+            if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as source:
+                data = source.read()
+            if len(data) < min_size:
+                continue
+            outputs = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                outputs.append(('.br', brotli.compress(data, quality=11)))
+            for suffix, body in outputs:
+                # solo merece la pena si de verdad ocupa menos
+                if len(body) < len(data):
+                    with open(path + suffix + '.tmp', 'wb') as target:
+                        target.write(body)
+                    os.replace(path + suffix + '.tmp', path + suffix)
+                    written += 1
+    return written
+
+
+class StaticFrontend:
+    def __init__(self):
+        self._manifest = {}
+
+    def init_app(self, app, root):
+        self.root = root
+        self._manifest = build_manifest(root) if os.path.isdir(root) else {}
+
+    def _negotiate(self, entry):
+        accepted = request.accept_encodings
+        for encoding, _ in PRECOMPRESSED:
+            if encoding in entry.encodings and accepted[encoding]:
+                return encoding
+        return None
+
+    def serve(self, path):
+        """
+        Respuesta para path dentro de dist/; lo que no esta en el manifiesto es
+        una ruta del frontend y recibe index.html.
+        """
+        entry = self._manifest.get(path)
+        if entry is None:
+            entry = self._manifest.get(INDEX_FILE)
+            if entry is None:
+                return jsonify({"msg": "Frontend not built, run npm run build"}), 404
+
+        encoding = self._negotiate(entry)
+        file_path, etag = entry.encodings[encoding] if encoding else (entry.path, entry.etag)
+        # send_file pone public + max-age con max_age y no-cache (revalidar) sin el
+        response = send_file(file_path, mimetype=entry.mimetype, etag=etag,
+                             last_modified=entry.last_modified, conditional=True,
+                             max_age=IMMUTABLE_MAX_AGE if entry.immutable else None)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if entry.encodings:
+            response.vary.add('Accept-Encoding')
+        if entry.immutable:
+            response.cache_control.immutable = True
+        return response
+
+
+static_frontend = StaticFrontend()
+
+
+def setup_static_files(app, root):
+    static_frontend.init_app(app, root)
@@ -0,0 +1,164 @@
+"""
+Almacen de fotos de perfil direccionado por contenido.
+
+- La subida se copia a disco por bloques mientras se calcula su sha256 y se corta
+  en cuanto pasa de PICTURE_MAX_BYTES (ademas la peticion entera ya se limita con
+  max_content_length antes de leer el cuerpo).
+- Cada imagen se guarda una sola vez como <sha256>.<ext> (y sus variantes, ver
+  api/images.py). Si otro usuario sube la misma foto se reutiliza sin procesarla.
+- picture_blobs lleva un ref_count con los usuarios cuyo profile_image_url apunta
+  a cada foto; assign_profile_picture lo mantiene en la misma transaccion que el
+  cambio de foto. flask gc-pictures borra las fotos sin referencias.
+- user.pending_picture es la ultima foto subida que se esta procesando. Al
+  terminar solo se asigna si sigue siendo esa: una subida anterior que acaba
+  tarde no pisa a una posterior, y cualquier cambio de foto la descarta.
+"""
+import datetime
+import hashlib
+import os
+import re
+import tempfile
+import time
+from api.models import db, User, PictureBlobs
+
+CHUNK_SIZE = 64 * 1024
+STAGING_SUFFIX = '.upload'
+VARIANT_SEPARATOR = '-'
+# "<sha256>.jpg", "<sha256>-large.webp"...; las fotos antiguas son user_<id>_<fecha>.jpg
+CONTENT_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}[.-]')
+# cabeceras multipart y campos del formulario, aparte del fichero
+MULTIPART_OVERHEAD = 16 * 1024
+# una foto sin referencias puede estar a mitad de procesado: no se borra antes de esto
+DEFAULT_GC_GRACE = 3600
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def save_upload(file_storage, folder, max_bytes):
+    """
+    Copia el fichero subido a un temporal de folder calculando su sha256.
+    Devuelve (ruta_temporal, sha256_hex). Lanza UploadTooLarge si pasa de max_bytes.
+    """
+    digest = hashlib.sha256()
+    written = 0
+    handle = tempfile.NamedTemporaryFile(dir=folder, suffix=STAGING_SUFFIX, delete=False)
+    try:
+        with handle:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge()
+                digest.update(chunk)
+                handle.write(chunk)
+    except BaseException:
+        os.remove(handle.name)
+        raise
+    return handle.name, digest.hexdigest()
+
+
+def register_picture(filename):
+    # fila de la foto antes de procesarla: el gc la respeta durante el periodo de gracia
+    if db.session.get(PictureBlobs, filename) is None:
+        db.session.add(PictureBlobs(filename=filename))
+        db.session.flush()
+
+
+def mark_picture_ready(filename):
+    db.session.execute(db.update(PictureBlobs).where(PictureBlobs.filename == filename).values(
+        ready=True, updated_at=datetime.datetime.utcnow()).execution_options(synchronize_session=False))
+
+
+def assign_profile_picture(user_id, filename, require_ready=False):
+    """
+    Cambia la foto del usuario (None = sin foto) ajustando los ref_count dentro de
+    la transaccion actual. Con require_ready solo la asigna si la foto ya esta
+    procesada y devuelve False si no (o si el gc la acaba de borrar).
+    """
+    if filename is not None:
+        conditions = [PictureBlobs.filename == filename]
+        if require_ready:
+            conditions.append(PictureBlobs.ready.is_(True))
+        # sumar antes de tocar al usuario: si la fila ya no existe el gc gano la carrera
+        claimed = db.session.execute(db.update(PictureBlobs).where(*conditions).values(
+            ref_count=PictureBlobs.ref_count + 1, updated_at=datetime.datetime.utcnow())
+            .execution_options(synchronize_session=False)).rowcount
+        if not claimed:
+            return False
+
+    user = db.session.get(User, user_id, with_for_update=True)
+    previous = user.profile_image_url
+    user.profile_image_url = filename
+    user.pending_picture = None
+    if previous is not None:
+        db.session.execute(db.update(PictureBlobs).where(PictureBlobs.filename == previous).values(
+            ref_count=PictureBlobs.ref_count - 1, updated_at=datetime.datetime.utcnow())
+            .execution_options(synchronize_session=False))
+    return True
+
+
+def set_pending_picture(user_id, filename):
+    db.session.execute(db.update(User).where(User.id == user_id).values(pending_picture=filename)
+                       .execution_options(synchronize_session=False))
+
+
+def assign_pending_picture(user_id, filename):
+    """
+    Asigna la foto recien procesada si sigue siendo la ultima subida del usuario.
+    Devuelve False si otra subida (o un cambio de foto) la ha sustituido.
+    """
+    claimed = db.session.execute(db.update(User).where(
+        User.id == user_id, User.pending_picture == filename).values(pending_picture=None)
+        .execution_options(synchronize_session=False)).rowcount
+    return bool(claimed) and assign_profile_picture(user_id, filename)
+
+
+def _picture_stem(name):
+    # "<sha>-large.webp" -> "<sha>"; los ficheros antiguos "user_1_2025.jpg" -> "user_1_2025"
+    stem = name.rsplit('.', 1)[0]
+    base, separator, size = stem.rpartition(VARIANT_SEPARATOR)
+    return base if separator and size in ('small', 'medium', 'large') else stem
+
+
+def collect_garbage(folder, grace, remove_files):
+    """
+    Borra las fotos que llevan mas de grace segundos sin referencias (con sus
+    variantes), los ficheros <sha256> que no son de ninguna foto registrada y
+    los temporales abandonados. Los ficheros con otro nombre (fotos antiguas,
+    algunas en el repo) solo se borran si estan en picture_blobs sin
+    referencias. Devuelve (fotos, ficheros sueltos).
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=grace)
+    candidates = db.session.scalars(db.select(PictureBlobs.filename).where(
+        PictureBlobs.ref_count <= 0, PictureBlobs.updated_at < cutoff)).all()
+
+    removed = 0
+    for filename in candidates:
+        # el ref_count se comprueba otra vez al borrar por si alguien la asigno entre medias
+        deleted = db.session.execute(db.delete(PictureBlobs).where(
+            PictureBlobs.filename == filename, PictureBlobs.ref_count <= 0)).rowcount
+        db.session.commit()
+        if deleted:
+            remove_files(folder, filename)
+            removed += 1
+
+    known_stems = {_picture_stem(filename) for filename in db.session.scalars(
+        db.select(PictureBlobs.filename))}
+    orphans = 0
+    cutoff_timestamp = time.time() - grace
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if not os.path.isfile(path) or os.path.getmtime(path) >= cutoff_timestamp:
+            continue
+        if name.endswith((STAGING_SUFFIX, '.tmp')):
+            stray = True
+        else:
+            stray = CONTENT_HASH_PATTERN.match(name) is not None and _picture_stem(name) not in known_stems
+        if stray:
+            os.remove(path)
+            orphans += 1
+    return removed, orphans
@@ -0,0 +1,138 @@
+"""
+Catalogo de tags en memoria del proceso.
+
+La tabla tags es pequeña y casi nunca cambia, asi que la cargamos entera una vez
+y respondemos autocompletado y busquedas de tags sin ir a la base de datos.
+Cualquier commit que inserte/modifique/borre un tag invalida el catalogo; como
+red de seguridad entre workers distintos tambien se recarga cada CATALOG_TTL segundos.
+"""
+import bisect
+import hashlib
+import json
+import re
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from api.models import db, Tags
+
+CATALOG_TTL = 60
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+# mayor que cualquier caracter: [prefix, prefix + PREFIX_END) es el rango de claves con ese prefijo
+PREFIX_END = '\U0010ffff'
+WORD_PATTERN = re.compile(r'\S+')
+
+
+class TagCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._loaded_at = 0.0
+
+    def _load(self):
+        tags = db.session.query(Tags.tag_id, Tags.name).order_by(Tags.tag_id).all()
+        serialized = [{"tag_id": tag_id, "name": name} for tag_id, name in tags]
+        # ordenados por nombre normalizado para poder buscar prefijos con bisect
+        entries = sorted((name.casefold(), tag_id, name) for tag_id, name in tags)
+        # una clave por palabra: "salud mental" se encuentra por "salud" y por "mental"
+        words = sorted((key[match.start():], tag_id)
+                       for key, tag_id, _ in entries for match in WORD_PATTERN.finditer(key))
+        # la version sale del contenido, asi todos los workers dan el mismo ETag
+        version = hashlib.sha1(json.dumps(serialized, sort_keys=True).encode('utf-8')).hexdigest()
+        return {
+            "keys": [entry[0] for entry in entries],
+            "entries": entries,
+            "word_keys": [word[0] for word in words],
+            "word_ids": [word[1] for word in words],
+            "by_name": {name: tag_id for tag_id, name in tags},
+            "serialized": serialized,
+            "version": version,
+        }
+
+    def _get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._loaded_at < CATALOG_TTL:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or time.monotonic() - self._loaded_at >= CATALOG_TTL:
+                self._snapshot = self._load()
+                self._loaded_at = time.monotonic()
+            return self._snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def listing(self):
+        """
+        (version, lista de tags) del mismo snapshot: leidos por separado, una
+        invalidacion entre medias daria un ETag que no es el del cuerpo.
+        """
+        snapshot = self._get()
+        return snapshot["version"], snapshot["serialized"]
+
+    def resolve(self, names):
+        """
+        Traduce nombres de tag a ids. Con el catalogo caliente no hace ninguna query;
+        los nombres que no conoce se buscan con un unico IN por si el catalogo esta
+        desactualizado (tag creado desde otro worker). Devuelve (ids, nombres_faltantes).
+        """
+        by_name = self._get()["by_name"]
+        ids = {name: by_name[name] for name in names if name in by_name}
+        unknown = [name for name in names if name not in ids]
+        if unknown:
+            found = db.session.query(Tags.name, Tags.tag_id).filter(
+                Tags.name.in_(unknown)).all()
+            if found:
+                self.invalidate()
+            ids.update(dict(found))
+
+        tag_ids = []
+        for name in names:
+            if name in ids and ids[name] not in tag_ids:
+                tag_ids.append(ids[name])
+        missing = [name for name in names if name not in ids]
+        return tag_ids, missing
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGESTIONS):
+        snapshot = self._get()
+        prefix = prefix.casefold()
+        keys, entries = snapshot["keys"], snapshot["entries"]
+        start = bisect.bisect_left(keys, prefix)
+        suggestions = []
+        for key, tag_id, name in entries[start:start + limit]:
+            if not key.startswith(prefix):
+                break
+            suggestions.append({"tag_id": tag_id, "name": name})
+        return suggestions
+
+    def matching_ids(self, prefix):
+        # ids de los tags con alguna palabra que empieza por prefix (sin distinguir mayusculas)
+        snapshot = self._get()
+        prefix = prefix.casefold()
+        keys = snapshot["word_keys"]
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + PREFIX_END, start)
+        return list(dict.fromkeys(snapshot["word_ids"][start:end]))
+
+
+tag_catalog = TagCatalog()
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_tag_changes(session, flush_context):
+    changed = session.new | session.dirty | session.deleted
+    if any(isinstance(obj, Tags) for obj in changed):
+        session.info['tags_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_tag_catalog(session):
+    if session.info.pop('tags_changed', False):
+        tag_catalog.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_tag_changes(session):
+    session.info.pop('tags_changed', None)
@@ -1,4 +1,17 @@
-from flask import jsonify, url_for
+from flask import jsonify, url_for, request, make_response, current_app, Response, stream_with_context
+from sqlalchemy import and_, or_
+from api.compression import cached_response, etag_variants
+import base64
+import hashlib
+import datetime
+
+# Paginacion por cursor (keyset): el feed cuesta lo mismo con 10k o 10M notas
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# filas por lote al iterar queries con yield_per en las respuestas en streaming
+STREAM_BATCH_SIZE = 200
+NDJSON_MIMETYPE = 'application/x-ndjson'
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +28,167 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def get_page_limit(args):
+    # lee ?limit= y lo acota al maximo permitido por el servidor
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise APIException("El parámetro limit debe ser un número entero", 400)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+# maximo de ids por llamada en los endpoints batch (votos, favoritos...)
+MAX_BATCH_IDS = 200
+
+def parse_id_list(args, name):
+    # ?note_ids=1,2,3 (o ?note_ids=1&note_ids=2) -> [1, 2, 3] sin duplicados
+    raw_values = []
+    for value in args.getlist(name):
+        raw_values.extend(part for part in value.split(',') if part.strip())
+    try:
+        ids = list(dict.fromkeys(int(value) for value in raw_values))
+    except ValueError:
+        raise APIException(f"{name} debe ser una lista de números enteros", 400)
+    return ids
+
+def parse_id(args, name):
+    # ?note_id=5 -> 5; None si no viene. Un valor que no es un entero es un 400, no se ignora
+    value = args.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise APIException(f"{name} debe ser un número entero", 400)
+
+def encode_cursor(created_at, row_id):
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, row_id = raw.rsplit('|', 1)
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeError):
+        raise APIException("Cursor inválido", 400)
+
+def paginate_keyset(query, created_column, id_column, args):
+    """
+    Pagina una query en orden (created_at, id) descendente.
+    Devuelve (items, next_cursor); next_cursor es None en la ultima pagina.
+    """
+    limit = get_page_limit(args)
+    cursor = args.get('cursor')
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            created_column < created_at,
+            and_(created_column == created_at, id_column < row_id)
+        ))
+
+    # pedimos una fila extra para saber si hay otra pagina sin hacer COUNT(*)
+    items = query.order_by(created_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(
+            getattr(last, created_column.key), getattr(last, id_column.key))
+    return items, next_cursor
+
+def make_etag(*parts):
+    # ETag fuerte a partir de los validadores baratos (ids, versiones, fechas)
+    raw = "|".join(str(part) for part in parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def conditional_response(etag, last_modified, build_response):
+    """
+    GET condicional: si el cliente ya tiene la version (If-None-Match o
+    If-Modified-Since) respondemos 304 sin llamar a build_response().
+    last_modified es un datetime naive en UTC o None.
+    """
+    if last_modified is not None:
+        # HTTP solo tiene precision de segundos
+        last_modified = last_modified.replace(
+            microsecond=0, tzinfo=datetime.timezone.utc)
+
+    # la copia del cliente puede ser la comprimida: "<etag>-gzip" / "<etag>-br"
+    matched_etag = etag
+    if request.if_none_match:
+        matched_etag = next((tag for tag in etag_variants(etag)
+                             if request.if_none_match.contains(tag)), None)
+        not_modified = matched_etag is not None
+    elif request.if_modified_since and last_modified is not None:
+        not_modified = last_modified <= request.if_modified_since
+    else:
+        not_modified = False
+
+    if not_modified:
+        response = make_response('', 304)
+        response.set_etag(matched_etag)
+        response.vary.add('Accept-Encoding')
+    else:
+        # si ya tenemos el cuerpo comprimido de esta version no lo reconstruimos
+        response = cached_response(etag)
+        if response is None:
+            response = make_response(build_response())
+            # compress_response le añade el sufijo si la comprime
+            response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # el cliente puede guardar la respuesta pero debe revalidarla siempre
+    response.cache_control.no_cache = True
+    return response
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(
+        ['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def stream_list_response(items, key=None, extra=None):
+    """
+    Respuesta en streaming para listas grandes: la memoria no crece con el
+    numero de filas. items es un iterable de dicts (p.ej. un generador sobre
+    query.yield_per(STREAM_BATCH_SIZE)).
+
+    - JSON (por defecto): [...] o, con key, {key: [...], **extra}
+    - NDJSON (?format=ndjson o Accept: application/x-ndjson): un objeto por
+      linea; los valores de extra van en cabeceras X-<Nombre> (next_cursor -> X-Next-Cursor)
+    """
+    dumps = current_app.json.dumps
+    extra = extra or {}
+    ndjson = wants_ndjson()
+
+    def chunks():
+        # agrupamos varios objetos por chunk para no escribir al socket fila a fila
+        buffer = []
+        for index, item in enumerate(items):
+            if ndjson:
+                buffer.append(dumps(item) + '\n')
+            else:
+                buffer.append((',' if index else '') + dumps(item))
+            if len(buffer) >= STREAM_BATCH_SIZE:
+                yield ''.join(buffer)
+                buffer = []
+        if buffer:
+            yield ''.join(buffer)
+
+    if ndjson:
+        response = Response(stream_with_context(chunks()), mimetype=NDJSON_MIMETYPE)
+        for name, value in extra.items():
+            if value is not None:
+                response.headers['X-' + name.replace('_', '-').title()] = str(value)
+        return response
+
+    def generate_json():
+        yield '{' + dumps(key) + ':[' if key else '['
+        yield from chunks()
+        tail = ''.join(',' + dumps(name) + ':' + dumps(value) for name, value in extra.items())
+        yield ']' + tail + '}' if key else ']'
+
+    return Response(stream_with_context(generate_json()), mimetype='application/json')
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
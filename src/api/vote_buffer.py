@@ -0,0 +1,281 @@
+"""
+Modo write-behind de los contadores de votos (opcional, VOTE_WRITE_BEHIND=1).
+
+Con una nota viral todos los create_vote hacen UPDATE sobre la misma fila de
+notes y se serializan en su lock. En este modo la fila de votes (una por usuario,
+sin contencion) se sigue escribiendo en la peticion, pero el delta del contador:
+
+1. se añade a un log local del worker (una linea por evento, fsync opcional),
+2. se acumula en memoria (models.unflushed_vote_deltas, que suman las lecturas;
+   models.unflushed_note_votes marca la nota para que sus ETag cambien ya),
+3. cada VOTE_FLUSH_INTERVAL segundos se vuelca agregado en una sola transaccion:
+   un UPDATE por nota/comentario con votos nuevos, sin importar cuantos fueran.
+
+Cada volcado rota el log: los deltas del log anterior se aplican junto con una
+fila en vote_log_checkpoints y despues se borra el fichero. Al arrancar (y cada
+RECOVERY_INTERVAL segundos) se reaplican los logs huerfanos de workers caidos;
+los que ya tienen checkpoint solo se borran, asi un replay nunca cuenta dos veces.
+Los logs activos tienen un flock, que el sistema suelta si el proceso muere.
+
+Los deltas sin volcar solo los ve el worker que los recibio; los demas los ven
+tras el siguiente volcado. Un voto confirmado cuyo evento no llego al log (crash
+entre el commit y la escritura) lo corrige flask reconcile-vote-counts.
+
+Configuracion (variables de entorno o app.config):
+VOTE_WRITE_BEHIND, VOTE_LOG_DIR (por defecto <instance>/vote-log),
+VOTE_FLUSH_INTERVAL, VOTE_LOG_FSYNC.
+"""
+import atexit
+import fcntl
+import glob
+import itertools
+import os
+import socket
+import threading
+import uuid
+from api.models import db, VoteLogCheckpoints, apply_vote_deltas, unflushed_vote_deltas, unflushed_note_votes
+
+RECOVERY_INTERVAL = 30
+LOG_SUFFIX = '.log'
+
+
+def _add_delta(deltas, key, positive_delta, negative_delta):
+    positive_votes, negative_votes = deltas.get(key, (0, 0))
+    positive_votes += positive_delta
+    negative_votes += negative_delta
+    if positive_votes or negative_votes:
+        # tuplas nuevas: las lecturas sin lock nunca ven un par a medio actualizar
+        deltas[key] = (positive_votes, negative_votes)
+    else:
+        deltas.pop(key, None)
+
+
+class VoteLog:
+    # fichero de log con su flock; el log_id es el nombre del fichero
+    def __init__(self, path, fd):
+        self.path = path
+        self.fd = fd
+        self.log_id = os.path.basename(path)
+
+    @classmethod
+    def create(cls, log_dir):
+        name = f"votes-{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        tmp_path = os.path.join(log_dir, name + '.tmp')
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        # solo aparece como .log ya bloqueado, asi la recuperacion nunca lo toma por huerfano
+        path = os.path.join(log_dir, name + LOG_SUFFIX)
+        os.rename(tmp_path, path)
+        return cls(path, fd)
+
+    @classmethod
+    def claim_orphan(cls, path):
+        # None si el log sigue abierto por un worker vivo
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        if not os.path.exists(path):
+            # otro worker lo aplico y lo borro mientras lo abriamos
+            os.close(fd)
+            return None
+        return cls(path, fd)
+
+    def append(self, line, sync):
+        os.write(self.fd, line)
+        if sync:
+            os.fsync(self.fd)
+
+    def read_deltas(self):
+        deltas = {}
+        with open(self.path, 'rb') as log_file:
+            for line in log_file:
+                try:
+                    kind, target_id, positive_delta, negative_delta = line.decode('ascii').split()
+                    key = (kind, int(target_id))
+                    positive_delta, negative_delta = int(positive_delta), int(negative_delta)
+                except ValueError:
+                    # linea cortada por un crash a mitad de escritura
+                    continue
+                if kind in ('note', 'comment'):
+                    _add_delta(deltas, key, positive_delta, negative_delta)
+        return deltas
+
+    def discard(self):
+        # primero se borra y luego se suelta el flock: nadie puede reclamarlo despues
+        os.unlink(self.path)
+        os.close(self.fd)
+
+
+class VoteWriteBehind:
+    def __init__(self):
+        self.enabled = False
+        self._app = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._log = None
+        self._pending = {}
+        # {note_id: secuencia} de los votos del log activo
+        self._pending_notes = {}
+        self._sequence = itertools.count(1)
+        self._log_events = 0
+        # lotes ya rotados cuyo volcado fallo; se reintentan en el siguiente ciclo
+        self._retry = []
+        self._thread = None
+
+    def init_app(self, app):
+        app.config.setdefault('VOTE_WRITE_BEHIND', os.getenv('VOTE_WRITE_BEHIND') == '1')
+        app.config.setdefault('VOTE_LOG_DIR', os.getenv(
+            'VOTE_LOG_DIR', os.path.join(app.instance_path, 'vote-log')))
+        app.config.setdefault('VOTE_FLUSH_INTERVAL', float(os.getenv('VOTE_FLUSH_INTERVAL', 1.0)))
+        app.config.setdefault('VOTE_LOG_FSYNC', os.getenv('VOTE_LOG_FSYNC', '1') == '1')
+        if not app.config['VOTE_WRITE_BEHIND']:
+            return
+
+        self._app = app
+        self._log_dir = app.config['VOTE_LOG_DIR']
+        self._interval = app.config['VOTE_FLUSH_INTERVAL']
+        self._fsync = app.config['VOTE_LOG_FSYNC']
+        os.makedirs(self._log_dir, exist_ok=True)
+        self._log = VoteLog.create(self._log_dir)
+        self.enabled = True
+
+        self._thread = threading.Thread(target=self._run, name='vote-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def record(self, kind, target_id, positive_delta, negative_delta, note_id):
+        """
+        Registra el delta de un voto ya confirmado en la db. note_id es la nota
+        del voto (o la del comentario votado). Si el log no se puede escribir el
+        delta se aplica directamente para no perderlo.
+        """
+        if not positive_delta and not negative_delta:
+            return
+        line = f"{kind} {target_id} {positive_delta} {negative_delta}\n".encode('ascii')
+        key = (kind, target_id)
+        try:
+            with self._lock:
+                self._log.append(line, self._fsync)
+                self._log_events += 1
+                _add_delta(self._pending, key, positive_delta, negative_delta)
+                _add_delta(unflushed_vote_deltas, key, positive_delta, negative_delta)
+                sequence = next(self._sequence)
+                self._pending_notes[note_id] = sequence
+                unflushed_note_votes[note_id] = sequence
+        except OSError:
+            self._app.logger.exception("No se pudo escribir el log de votos, se aplica el voto directamente")
+            apply_vote_deltas(kind, target_id, positive_delta, negative_delta)
+            db.session.commit()
+
+    def flush(self):
+        # rota el log activo y vuelca sus deltas (y los lotes pendientes de reintento)
+        with self._flush_lock:
+            with self._lock:
+                # un log con eventos que se anulan (votar y retirar) tambien se rota
+                if self._log_events:
+                    self._retry.append((self._log, self._pending, self._pending_notes))
+                    self._log = VoteLog.create(self._log_dir)
+                    self._pending = {}
+                    self._pending_notes = {}
+                    self._log_events = 0
+                batches, self._retry = self._retry, []
+
+            failed = []
+            for vote_log, deltas, notes in batches:
+                try:
+                    self._apply(vote_log, deltas)
+                except Exception:
+                    self._app.logger.exception("Fallo el volcado de votos de %s", vote_log.log_id)
+                    failed.append((vote_log, deltas, notes))
+                    continue
+                with self._lock:
+                    for key, (positive_delta, negative_delta) in deltas.items():
+                        _add_delta(unflushed_vote_deltas, key, -positive_delta, -negative_delta)
+                    # el volcado subio la version; la marca se queda si hubo votos despues
+                    for note_id, sequence in notes.items():
+                        if unflushed_note_votes.get(note_id) == sequence:
+                            del unflushed_note_votes[note_id]
+                self._discard(vote_log)
+
+            if failed:
+                with self._lock:
+                    self._retry = failed + self._retry
+
+    def recover(self):
+        """
+        Aplica los logs de workers que murieron sin volcarlos. Los logs que ya
+        tienen checkpoint (crash entre el commit y el borrado) solo se borran.
+        """
+        for path in sorted(glob.glob(os.path.join(self._log_dir, '*' + LOG_SUFFIX))):
+            vote_log = VoteLog.claim_orphan(path)
+            if vote_log is None:
+                continue
+            try:
+                with self._app.app_context():
+                    applied = db.session.get(VoteLogCheckpoints, vote_log.log_id) is not None
+                if not applied:
+                    self._apply(vote_log, vote_log.read_deltas())
+            except Exception:
+                self._app.logger.exception("No se pudo recuperar el log de votos %s", vote_log.log_id)
+                os.close(vote_log.fd)
+                continue
+            self._discard(vote_log)
+
+    def shutdown(self):
+        self._stop.set()
+        self.flush()
+        with self._lock:
+            # tras el ultimo volcado el log activo queda vacio, no hay nada que recuperar
+            if not self._log_events:
+                self._log.discard()
+
+    def _apply(self, vote_log, deltas):
+        with self._app.app_context():
+            try:
+                # orden fijo de filas para que dos workers volcando a la vez no se bloqueen en cruz
+                for (kind, target_id), (positive_delta, negative_delta) in sorted(deltas.items()):
+                    apply_vote_deltas(kind, target_id, positive_delta, negative_delta)
+                db.session.add(VoteLogCheckpoints(log_id=vote_log.log_id))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _discard(self, vote_log):
+        vote_log.discard()
+        # el checkpoint ya no hace falta: sin fichero no hay nada que reaplicar
+        try:
+            with self._app.app_context():
+                db.session.execute(db.delete(VoteLogCheckpoints).where(
+                    VoteLogCheckpoints.log_id == vote_log.log_id))
+                db.session.commit()
+        except Exception:
+            self._app.logger.exception("No se pudo borrar el checkpoint %s", vote_log.log_id)
+
+    def _run(self):
+        next_recovery = 0.0
+        elapsed = 0.0
+        while not self._stop.wait(self._interval):
+            elapsed += self._interval
+            try:
+                if elapsed >= next_recovery:
+                    # al arrancar y despues cada RECOVERY_INTERVAL segundos
+                    self.recover()
+                    next_recovery = elapsed + RECOVERY_INTERVAL
+                self.flush()
+            except Exception:
+                self._app.logger.exception("Fallo el ciclo de volcado de votos")
+
+
+vote_buffer = VoteWriteBehind()
+
+
+def setup_vote_buffer(app):
+    vote_buffer.init_app(app)
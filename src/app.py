@@ -1,4 +1,4 @@
-from api.routes import api, bcrypt
+from api.routes import api
 import os
 from flask import Flask, request, jsonify, url_for, send_from_directory
 from flask_migrate import Migrate
@@ -11,6 +11,15 @@ from api.models import db
 
 from api.admin import setup_admin
 from api.commands import setup_commands
+from api.compression import setup_compression
+from api.vote_buffer import setup_vote_buffer
+from api.live import setup_live_events
+from api.images import setup_image_pipeline
+from api.static_files import setup_static_files, static_frontend
+from api.passwords import setup_password_hasher
+from api.rate_limit import setup_rate_limit
+from api.google_certs import setup_google_certs
+from api.identity import setup_identity
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 
@@ -35,9 +44,6 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 MIGRATE = Migrate(app, db, compare_type=True)
 db.init_app(app)
 
-
-bcrypt.init_app(app)
-
 app.config["JWT_SECRET_KEY"] = "clave-de-prueba-simple-sin-caracteres-raros"
 app.config["JWT_CSRF_PROTECTION"] = False
 app.config["UPLOAD_FOLDER"] = "src/front/assets/img/ProfilePictures"
@@ -46,10 +52,19 @@ UPLOAD_FOLDER = 'src/front/assets/img/ProfilePictures'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 jwt = JWTManager(app)
+setup_identity(app, jwt)
 
 # Setup admin y commands
 setup_admin(app)
 setup_commands(app)
+setup_compression(app)
+setup_vote_buffer(app)
+setup_live_events(app, jwt)
+setup_image_pipeline(app)
+setup_password_hasher(app)
+setup_rate_limit(app)
+setup_google_certs(app)
+setup_static_files(app, static_file_dir)
 
 # Registra el blueprint de la API
 app.register_blueprint(api, url_prefix='/api')
@@ -68,18 +83,15 @@ def handle_invalid_usage(error):
 def sitemap():
     if ENV == "development":
         return generate_sitemap(app)
-    return send_from_directory(static_file_dir, 'index.html')
+    return static_frontend.serve('index.html')
 
 # any other endpoint will try to serve it like a static file
 
 
 @app.route('/<path:path>', methods=['GET'])
 def serve_any_other_file(path):
-    if not os.path.isfile(os.path.join(static_file_dir, path)):
-        path = 'index.html'
-    response = send_from_directory(static_file_dir, path)
-    response.cache_control.max_age = 0  # avoid cache memory
-    return response
+    # cache y precomprimidos segun el manifiesto de dist/ (ver api/static_files.py)
+    return static_frontend.serve(path)
 
 
 # this only runs if `$ python src/main.py` is executed
@@ -13,6 +13,8 @@ export const Home = () => {
   const [sortOption, setSortOption] = useState("recent");
   const [searchTerm, setSearchTerm] = useState("");
   const [activeSearchTerm, setActiveSearchTerm] = useState("");
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const navigate = useNavigate();
 
   const backendUrl = "https://glorious-cod-5g5ggj5wjj7whv5qp-3001.app.github.dev/";
@@ -40,28 +42,12 @@ export const Home = () => {
         throw new Error(`Error ${response.status}: ${response.statusText}`);
       }
 
-      const data = await response.json();
+      const page = await response.json();
+      const data = page.notes;
       setNotes(data);
+      setNextCursor(page.next_cursor);
 
-      const token = localStorage.getItem("token");
-      if (token) {
-        try {
-          const votePromises = data.map((note) =>
-            getUserVoteForNote(note.note_id || note.id)
-          );
-
-          const votes = await Promise.all(votePromises);
-          const votesMap = {};
-          data.forEach((note, index) => {
-            votesMap[note.note_id || note.id] = votes[index];
-          });
-
-          setUserVotes(votesMap);
-        } catch (voteError) {
-          console.error("Error obteniendo votos:", voteError);
-          setUserVotes({});
-        }
-      }
+      await fetchUserVotes(data.map((note) => note.note_id || note.id));
     } catch (err) {
       console.error("Error fetching notes:", err);
       setError(err.message);
@@ -70,13 +56,37 @@ export const Home = () => {
     }
   };
 
-  const getUserVoteForNote = async (noteId) => {
+  const loadMoreNotes = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const response = await fetch(
+        `${backendUrl}/api/notes?cursor=${encodeURIComponent(nextCursor)}`
+      );
+
+      if (!response.ok) {
+        throw new Error(`Error ${response.status}: ${response.statusText}`);
+      }
+
+      const page = await response.json();
+      setNotes((prevNotes) => [...prevNotes, ...page.notes]);
+      setNextCursor(page.next_cursor);
+      await fetchUserVotes(page.notes.map((note) => note.note_id || note.id));
+    } catch (err) {
+      console.error("Error cargando más notas:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // votos del usuario para toda la pagina en una sola llamada
+  const fetchUserVotes = async (noteIds) => {
     const token = localStorage.getItem("token");
-    if (!token) return 0;
+    if (!token || noteIds.length === 0) return;
 
     try {
       const response = await fetch(
-        `${backendUrl}api/votes/my-vote?note_id=${noteId}`,
+        `${backendUrl}api/my-state?note_ids=${noteIds.join(",")}`,
         {
           headers: {
             Authorization: `Bearer ${token}`,
@@ -86,17 +96,19 @@ export const Home = () => {
 
       if (response.status === 401) {
         handleTokenExpired();
-        return 0;
+        return;
       }
 
       if (response.ok) {
         const data = await response.json();
-        return data.vote_type;
+        const votesMap = {};
+        Object.entries(data.notes).forEach(([noteId, state]) => {
+          votesMap[noteId] = state.vote_type;
+        });
+        setUserVotes((prev) => ({ ...prev, ...votesMap }));
       }
-      return 0;
     } catch (error) {
-      console.error("Error obteniendo voto:", error);
-      return 0;
+      console.error("Error obteniendo votos:", error);
     }
   };
 
@@ -109,8 +121,9 @@ export const Home = () => {
     }
 
     try {
+      // votar otra vez lo mismo retira el voto
       const response = await fetch(`${backendUrl}api/vote`, {
-        method: "POST",
+        method: userVotes[noteId] === voteType ? "DELETE" : "POST",
         headers: {
           "Content-Type": "application/json",
           Authorization: `Bearer ${token}`,
@@ -556,8 +569,12 @@ export const Home = () => {
 
       {sortedNotes.length > 0 && (
         <div className="text-center mt-5">
-          <button className="btn btn-outline-secondary" disabled>
-            Cargar más notas
+          <button
+            className="btn btn-outline-secondary"
+            onClick={loadMoreNotes}
+            disabled={!nextCursor || loadingMore}
+          >
+            {loadingMore ? "Cargando..." : "Cargar más notas"}
           </button>
         </div>
       )}
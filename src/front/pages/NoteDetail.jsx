@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { useParams, useNavigate } from "react-router-dom";
 
 const NoteDetail = () => {
@@ -8,6 +8,10 @@ const NoteDetail = () => {
   const [currentUser, setCurrentUser] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
   const [userVotes, setUserVotes] = useState({});
+  const [commentsCursor, setCommentsCursor] = useState(null);
+  const [commentsCount, setCommentsCount] = useState(0);
+  const commentIdsRef = useRef(new Set());
+  const [loadingMoreComments, setLoadingMoreComments] = useState(false);
 
   // Estados para la edición de comentarios 
   const [editingCommentId, setEditingCommentId] = useState(null);
@@ -36,29 +40,16 @@ const NoteDetail = () => {
     }
   };
 
-  // Función para obtener los comentarios 
+  // Función para obtener los comentarios (primera página, los más recientes primero)
   const fetchComments = async () => {
     try {
       const response = await fetch(`${API_URL}/api/notes/${id}/comments`);
       if (response.ok) {
-        const data = await response.json();
-        setComments(data.reverse());
-        
-        // Obtener votos del usuario para los comentarios
-        const token = localStorage.getItem("token");
-        if (token) {
-          const votePromises = data.map(comment => 
-            getUserVoteForComment(comment.comment_id)
-          );
-          
-          const votes = await Promise.all(votePromises);
-          const votesMap = {};
-          data.forEach((comment, index) => {
-            votesMap[comment.comment_id] = votes[index];
-          });
-          
-          setUserVotes(prev => ({...prev, ...votesMap}));
-        }
+        const page = await response.json();
+        setComments(page.comments);
+        setCommentsCount(page.comments_count);
+        setCommentsCursor(page.next_cursor);
+        await fetchCommentVotes(page.comments.map(comment => comment.comment_id));
       } else {
         console.error("Error al obtener los comentarios.");
       }
@@ -67,6 +58,50 @@ const NoteDetail = () => {
     }
   };
 
+  const loadMoreComments = async () => {
+    if (!commentsCursor) return;
+    try {
+      setLoadingMoreComments(true);
+      const response = await fetch(
+        `${API_URL}/api/notes/${id}/comments?cursor=${encodeURIComponent(commentsCursor)}`
+      );
+      if (response.ok) {
+        const page = await response.json();
+        setComments(prev => [...prev, ...page.comments]);
+        setCommentsCursor(page.next_cursor);
+        await fetchCommentVotes(page.comments.map(comment => comment.comment_id));
+      } else {
+        console.error("Error al obtener más comentarios.");
+      }
+    } catch (error) {
+      console.error("Error en la conexión:", error);
+    } finally {
+      setLoadingMoreComments(false);
+    }
+  };
+
+  // Obtener votos del usuario para una página de comentarios en una sola llamada
+  const fetchCommentVotes = async (commentIds) => {
+    const token = localStorage.getItem("token");
+    if (!token || commentIds.length === 0) return;
+
+    const stateResponse = await fetch(`${API_URL}/api/my-state?comment_ids=${commentIds.join(",")}`, {
+      headers: {
+        'Authorization': `Bearer ${token}`
+      }
+    });
+
+    if (stateResponse.ok) {
+      const state = await stateResponse.json();
+      const votesMap = {};
+      Object.entries(state.comments).forEach(([commentId, commentState]) => {
+        votesMap[commentId] = commentState.vote_type;
+      });
+
+      setUserVotes(prev => ({...prev, ...votesMap}));
+    }
+  };
+
   // Función para obtener los detalles de la nota 
   const fetchNote = async () => {
     try {
@@ -114,29 +149,6 @@ const NoteDetail = () => {
     }
   };
 
-  // Función para obtener el voto del usuario para un comentario
-  const getUserVoteForComment = async (commentId) => {
-    const token = localStorage.getItem("token");
-    if (!token) return 0;
-    
-    try {
-      const response = await fetch(`${API_URL}/api/votes/my-vote?comment_id=${commentId}`, {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      });
-      
-      if (response.ok) {
-        const data = await response.json();
-        return data.vote_type;
-      }
-      return 0;
-    } catch (error) {
-      console.error("Error obteniendo voto:", error);
-      return 0;
-    }
-  };
-
   // Función para obtener el usuario actual 
   const fetchCurrentUser = async () => {
     const token = localStorage.getItem("token");
@@ -224,11 +236,32 @@ const NoteDetail = () => {
 
   }, [id]);
 
+  // Comentarios nuevos en vivo (SSE); EventSource reconecta solo con Last-Event-ID
+  useEffect(() => {
+    if (!id) return;
+
+    const source = new EventSource(`${API_URL}/api/notes/${id}/events`);
+    source.addEventListener("comment", (event) => {
+      const comment = JSON.parse(event.data);
+      // el propio comentario ya llega con fetchComments tras publicarlo
+      if (commentIdsRef.current.has(comment.comment_id)) return;
+      commentIdsRef.current.add(comment.comment_id);
+      setComments(prev => [comment, ...prev]);
+      setCommentsCount(count => count + 1);
+    });
+
+    return () => source.close();
+  }, [id]);
+
   // Manejador para el cambio de comentario 
   const handleCommentChange = (e) => {
     setCommentText(e.target.value);
   };
 
+  useEffect(() => {
+    commentIdsRef.current = new Set(comments.map(comment => comment.comment_id));
+  }, [comments]);
+
   // Función para comentar la nota 
   const handlePostComment = async () => {
     const token = localStorage.getItem("token");
@@ -500,7 +533,7 @@ const NoteDetail = () => {
         </div>
         
         <div>
-          <p className="text-center"> Comentarios ({comments.length})</p>
+          <p className="text-center"> Comentarios ({commentsCount})</p>
           {comments.map((comment) => (
             <div key={comment.comment_id} className="card mb-3 comment-card">
               <div className="card-body">
@@ -572,6 +605,17 @@ const NoteDetail = () => {
               </div>
             </div>
           ))}
+          {commentsCursor && (
+            <div className="text-center mb-3">
+              <button
+                className="btn btn-outline-secondary"
+                onClick={loadMoreComments}
+                disabled={loadingMoreComments}
+              >
+                {loadingMoreComments ? "Cargando..." : "Cargar más comentarios"}
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </div>
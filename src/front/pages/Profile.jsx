@@ -3,6 +3,9 @@ import { Link, useNavigate } from "react-router-dom";
 
 const Profile = () => {
   const [userNotes, setUserNotes] = useState([]);
+  const [notesCount, setNotesCount] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [userProfile, setUserProfile] = useState(null);
   const [bio, setBio] = useState("");
@@ -140,6 +143,21 @@ const Profile = () => {
     }
   };
 
+  const waitForProfilePicture = async (backendUrl, token, filename) => {
+    for (let attempt = 0; attempt < 20; attempt++) {
+      await new Promise((resolve) => setTimeout(resolve, 500));
+      const response = await fetch(`${backendUrl}api/profile/my-picture`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      if (response.ok) {
+        const picture = await response.json();
+        if (picture.filename === filename) return true;
+      }
+    }
+    alert("La foto no se pudo procesar, inténtalo de nuevo.");
+    return false;
+  };
+
   const handleFileUpload = async (event) => {
     const file = event.target.files[0];
     if (!file) {
@@ -196,6 +214,11 @@ const Profile = () => {
         
         // Close modal properly
         closeModal();
+
+        // La foto se procesa en segundo plano: esperamos a que pase a ser la del perfil
+        if (response.status === 202) {
+          await waitForProfilePicture(backendUrl, token, data.filename);
+        }
         
         // Refresh profile data to show new image
         await fetchUserProfile();
@@ -341,9 +364,12 @@ const Profile = () => {
       console.log("📊 Notes response status:", response.status);
 
       if (response.ok) {
-        const notes = await response.json();
-        console.log("✅ User notes data:", notes);
-        setUserNotes(notes);
+        const page = await response.json();
+        console.log("✅ User notes data:", page.notes);
+        setUserNotes(page.notes);
+        // la API pagina (20 por defecto): el total viene aparte en la primera pagina
+        setNotesCount(page.notes_count);
+        setNextCursor(page.next_cursor);
       } else {
         console.error("❌ Error fetching notes:", response.status);
         const errorText = await response.text();
@@ -357,6 +383,39 @@ const Profile = () => {
     }
   };
 
+  // Siguiente pagina de notas del usuario
+  const loadMoreNotes = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const token = localStorage.getItem("token");
+      const backendUrl = import.meta.env.VITE_BACKEND_URL;
+      const url = `${backendUrl}/api/profile/notes?cursor=${encodeURIComponent(
+        nextCursor
+      )}`.replace(/([^:]\/)\/+/g, "$1");
+
+      const response = await fetch(url, {
+        method: "GET",
+        headers: {
+          Authorization: `Bearer ${token}`,
+          "Content-Type": "application/json",
+        },
+      });
+
+      if (!response.ok) {
+        throw new Error(`Error ${response.status}: ${response.statusText}`);
+      }
+
+      const page = await response.json();
+      setUserNotes((prevNotes) => [...prevNotes, ...page.notes]);
+      setNextCursor(page.next_cursor);
+    } catch (error) {
+      console.error("Error cargando más notas:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Debug: Estado actual del componente
   console.log("📊 Component state:", {
     loading,
@@ -620,8 +679,8 @@ const Profile = () => {
                     <div className="d-flex justify-content-between align-items-center mb-4">
                       <h3>Mis Notas</h3>
                       <span className="badge bg-secondary">
-                        {userNotes.length}{" "}
-                        {userNotes.length === 1 ? "nota" : "notas"}
+                        {notesCount}{" "}
+                        {notesCount === 1 ? "nota" : "notas"}
                       </span>
                     </div>
                   </div>
@@ -757,6 +816,17 @@ const Profile = () => {
                       ))}
                     </div>
                   )}
+                  {!loading && nextCursor && (
+                    <div className="col-12 text-center mt-4">
+                      <button
+                        className="btn btn-outline-secondary"
+                        onClick={loadMoreNotes}
+                        disabled={loadingMore}
+                      >
+                        {loadingMore ? "Cargando..." : "Cargar más notas"}
+                      </button>
+                    </div>
+                  )}
                 </div>
               </div>
             </div>
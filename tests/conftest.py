@@ -0,0 +1,65 @@
+"""
+Fixtures de los tests de la API: la app de src/app.py contra una db SQLite en
+fichero (no en memoria: los tests de concurrencia abren varias conexiones) que
+se vacia antes de cada test.
+
+    pipenv install --dev
+    pipenv run test
+"""
+import os
+import sys
+import tempfile
+import pytest
+from sqlalchemy import text
+
+# app.py lee DATABASE_URL al importarse
+_db_dir = tempfile.mkdtemp(prefix='api-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+# bcrypt con el coste minimo, los tests no miden contraseñas
+os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from app import app as flask_app  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+from api import notifications, search  # noqa: E402
+from api.identity import identity_cache  # noqa: E402
+from api.models import db, User  # noqa: E402
+from api.tags import tag_catalog  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    flask_app.config['TESTING'] = True
+    flask_app.config['AUTH_RATE_LIMIT'] = False
+    with flask_app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text("DROP TABLE IF EXISTS notes_fts"))
+        db.drop_all()
+        db.create_all()
+        search._sqlite_index_ready = False
+        tag_catalog.invalidate()
+        identity_cache.clear()
+        yield flask_app
+        # las notificaciones se entregan en otro hilo despues del commit
+        notifications._executor.submit(lambda: None).result()
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """
+    Crea un usuario y devuelve (id, cabeceras con su token).
+    """
+    def make_user(username):
+        user = User(email=f"{username}@example.com", username=username, password_hash='',
+                    is_active=True, first_name=username, last_name='Test')
+        db.session.add(user)
+        db.session.commit()
+        token = create_access_token(identity=str(user.id))
+        return user.id, {"Authorization": f"Bearer {token}"}
+    return make_user
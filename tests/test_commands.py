@@ -0,0 +1,32 @@
+"""
+flask export-notes: NDJSON con una nota por linea y los usuarios (autor,
+comentaristas, votantes) por email, cargados con cada lote de notas.
+"""
+import json
+from api.models import db, Notes, Comments, Votes, Tags
+
+
+def test_export_notes_references_users_by_email(app, make_user, tmp_path):
+    author_id, _ = make_user('author')
+    reader_id, _ = make_user('reader')
+    note = Notes(user_id=author_id, title='Nota', content='Contenido', is_anonymous=False,
+                 tags=[Tags(name='deportes')])
+    db.session.add(note)
+    db.session.flush()
+    comment = Comments(note_id=note.note_id, user_id=reader_id, content='Comentario')
+    db.session.add(comment)
+    db.session.flush()
+    db.session.add_all([Votes(user_id=reader_id, note_id=note.note_id, vote_type=1),
+                        Votes(user_id=author_id, comment_id=comment.comment_id, vote_type=-1)])
+    db.session.commit()
+
+    path = tmp_path / 'notes.ndjson'
+    result = app.test_cli_runner().invoke(args=['export-notes', str(path)])
+    assert result.exit_code == 0, result.output
+
+    [record] = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert (record['user'], record['tags']) == ('author@example.com', ['deportes'])
+    assert record['votes'] == [{"user": 'reader@example.com', "vote_type": 1}]
+    [exported_comment] = record['comments']
+    assert exported_comment['user'] == 'reader@example.com'
+    assert exported_comment['votes'] == [{"user": 'author@example.com', "vote_type": -1}]
@@ -0,0 +1,44 @@
+"""
+ETag por codificacion: la respuesta comprimida lleva "<etag>-gzip" / "<etag>-br"
+y un If-None-Match con cualquiera de ellos responde 304.
+"""
+import pytest
+from api.models import db, Tags
+
+
+@pytest.fixture
+def tags(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 0)
+    db.session.add_all([Tags(name='deportes'), Tags(name='culinario')])
+    db.session.commit()
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br'])
+def test_compressed_responses_get_their_own_etag(client, tags, encoding):
+    plain = client.get('/api/tags')
+    etag, _ = plain.get_etag()
+    assert plain.headers.get('Content-Encoding') is None
+
+    # la segunda peticion sale de la cache de cuerpos comprimidos
+    for _ in range(2):
+        response = client.get('/api/tags', headers={"Accept-Encoding": encoding})
+        assert response.headers['Content-Encoding'] == encoding
+        assert response.get_etag() == (f"{etag}-{encoding}", False)
+        assert 'Accept-Encoding' in response.vary
+
+    revalidated = client.get('/api/tags', headers={
+        "Accept-Encoding": encoding, "If-None-Match": f'"{etag}-{encoding}"'})
+    assert revalidated.status_code == 304
+    assert revalidated.get_etag() == (f"{etag}-{encoding}", False)
+    assert 'Accept-Encoding' in revalidated.vary
+
+
+def test_uncompressed_etag_still_revalidates(client, tags):
+    etag, _ = client.get('/api/tags').get_etag()
+
+    revalidated = client.get('/api/tags', headers={"If-None-Match": f'"{etag}"'})
+    assert revalidated.status_code == 304
+    assert revalidated.get_etag() == (etag, False)
+
+    stale = client.get('/api/tags', headers={"If-None-Match": f'"{etag}x-gzip"'})
+    assert stale.status_code == 200
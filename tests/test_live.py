@@ -0,0 +1,38 @@
+"""
+Stream de notificaciones: EventSource no manda cabeceras, asi que se abre con
+un token de stream corto en ?jwt=; el token de sesion no vale en la URL y el
+de stream no vale para el resto de la API.
+"""
+import pytest
+
+
+@pytest.fixture
+def stream_token(client, make_user):
+    _, headers = make_user('reader')
+    response = client.post('/api/notifications/events/token', headers=headers)
+    assert response.status_code == 200
+    return headers, response.get_json()['token']
+
+
+def test_stream_opens_with_stream_token(app, client, stream_token, monkeypatch):
+    monkeypatch.setitem(app.config, 'SSE_MAX_DURATION', 0)
+    _, token = stream_token
+    response = client.get(f'/api/notifications/events?jwt={token}')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    response.close()
+
+
+def test_session_token_is_rejected_in_the_url(client, stream_token):
+    headers, _ = stream_token
+    session_token = headers['Authorization'].split()[1]
+    assert client.get(f'/api/notifications/events?jwt={session_token}').status_code == 401
+    # en la cabecera tampoco: el stream solo mira ?jwt=
+    assert client.get('/api/notifications/events', headers=headers).status_code == 401
+
+
+def test_stream_token_is_rejected_by_the_rest_of_the_api(client, stream_token):
+    _, token = stream_token
+    response = client.get('/api/notifications/unread-count', headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+    assert 'msg' in response.get_json()
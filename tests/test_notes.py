@@ -0,0 +1,25 @@
+"""
+Notas del usuario en /api/profile/notes: paginadas por cursor y con el total
+en la primera pagina para el contador del perfil.
+"""
+from api.models import db, Notes
+
+
+def test_profile_notes_pages_and_count(client, make_user):
+    user_id, headers = make_user('author')
+    other_id, _ = make_user('other')
+    db.session.add_all([Notes(user_id=user_id, title=f'Nota {index}', content='...', is_anonymous=False)
+                        for index in range(25)])
+    db.session.add(Notes(user_id=other_id, title='Ajena', content='...', is_anonymous=False))
+    db.session.commit()
+
+    first = client.get('/api/profile/notes', headers=headers).get_json()
+    assert len(first['notes']) == 20
+    assert first['notes_count'] == 25
+
+    second = client.get(f"/api/profile/notes?cursor={first['next_cursor']}", headers=headers).get_json()
+    assert len(second['notes']) == 5
+    assert second['next_cursor'] is None
+    assert 'notes_count' not in second
+    assert {note['note_id'] for note in first['notes'] + second['notes']} == set(
+        db.session.scalars(db.select(Notes.note_id).where(Notes.user_id == user_id)))
@@ -0,0 +1,20 @@
+"""
+POST /api/notifications/read: notification_ids tiene que ser una lista de
+enteros; true / false (bool es subclase de int en Python) son un 400.
+"""
+import pytest
+
+
+@pytest.mark.parametrize('notification_ids', [[True], [1, False], ['1'], [1.5]])
+def test_mark_read_rejects_non_integer_ids(client, make_user, notification_ids):
+    _, headers = make_user('reader')
+    response = client.post('/api/notifications/read', headers=headers,
+                           json={"notification_ids": notification_ids})
+    assert response.status_code == 400
+    assert 'msg' in response.get_json()
+
+
+def test_mark_read_accepts_integer_ids(client, make_user):
+    _, headers = make_user('reader')
+    response = client.post('/api/notifications/read', headers=headers, json={"notification_ids": [1, 2]})
+    assert response.status_code == 200
@@ -0,0 +1,62 @@
+"""
+Fotos de perfil: el indice en memoria de la carpeta no hace un stat por
+candidato en cada fallo, y una subida que termina de procesarse tarde no pisa
+la foto de una subida posterior.
+"""
+import os
+from concurrent.futures import Future
+import pytest
+from api.images import PictureIndex, picture_pipeline, variant_filename
+from api.models import db, User, PictureBlobs
+from api.storage import set_pending_picture
+
+HASH = 'a' * 64 + '.jpg'
+OTHER = 'b' * 64 + '.jpg'
+
+
+def test_misses_reload_the_folder_at_most_once_per_max_age(tmp_path, monkeypatch):
+    index = PictureIndex()
+    index.max_age = 60
+    (tmp_path / variant_filename(HASH, 'small', 'jpg')).write_bytes(b'x')
+    assert index.find(str(tmp_path), HASH, 'small', webp=True) == variant_filename(HASH, 'small', 'jpg')
+
+    # otro worker procesa otra foto: hasta que caduque el indice no se ve
+    (tmp_path / variant_filename(OTHER, 'small', 'webp')).write_bytes(b'x')
+    listings = []
+    real_listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir', lambda path: listings.append(path) or real_listdir(path))
+    monkeypatch.setattr(os.path, 'isfile', lambda path: pytest.fail(f'stat por peticion: {path}'))
+    for _ in range(5):
+        assert index.find(str(tmp_path), OTHER, 'small', webp=True) is None
+    assert index.find(str(tmp_path), HASH, 'small', webp=True) == variant_filename(HASH, 'small', 'jpg')
+    assert listings == []
+
+    index.max_age = 0
+    assert index.find(str(tmp_path), OTHER, 'small', webp=True) == variant_filename(OTHER, 'small', 'webp')
+    assert index.find(str(tmp_path), HASH, 'small', webp=True) == variant_filename(HASH, 'small', 'jpg')
+    assert len(listings) == 1
+
+
+def _finish(user_id, filename, tmp_path):
+    # lo que hace el pool al terminar render_variants, sin lanzar procesos
+    future = Future()
+    future.set_result([])
+    picture_pipeline._slots.acquire()
+    picture_pipeline._finish(future, user_id, filename, str(tmp_path / 'staging.upload'))
+    db.session.remove()
+
+
+def test_late_upload_does_not_replace_a_newer_one(app, make_user, tmp_path):
+    user_id, _ = make_user('author')
+    db.session.add_all([PictureBlobs(filename=HASH), PictureBlobs(filename=OTHER)])
+    set_pending_picture(user_id, HASH)
+    # segunda subida antes de que termine la primera
+    set_pending_picture(user_id, OTHER)
+    db.session.commit()
+
+    _finish(user_id, OTHER, tmp_path)
+    assert db.session.get(User, user_id).profile_image_url == OTHER
+    _finish(user_id, HASH, tmp_path)
+    user = db.session.get(User, user_id)
+    assert (user.profile_image_url, user.pending_picture) == (OTHER, None)
+    assert [db.session.get(PictureBlobs, name).ref_count for name in (HASH, OTHER)] == [0, 1]
@@ -0,0 +1,67 @@
+"""
+Las listas de notas cargan sus relaciones en un numero constante de queries:
+con 5 o con 50 notas (cada una con tags, votos, comentarios y favoritos) el
+numero de sentencias tiene que ser el mismo, sin N+1.
+"""
+import pytest
+from sqlalchemy import event
+from api.models import db, Notes, Comments, Tags, Votes, UserNoteFavorites
+
+ENDPOINTS = [
+    '/api/notes?limit=100',
+    '/api/notes/search?tag=deportes&limit=100',
+    '/api/favorites',
+]
+
+
+def _add_notes(count, author_id, reader_id, voter_ids, tag):
+    for index in range(count):
+        note = Notes(user_id=author_id, title=f'Nota {index}', content='Contenido',
+                     is_anonymous=False, tags=[tag])
+        db.session.add(note)
+        db.session.flush()
+        for voter_id in voter_ids:
+            db.session.add(Votes(user_id=voter_id, note_id=note.note_id, vote_type=1))
+            db.session.add(Comments(note_id=note.note_id, user_id=voter_id, content='Comentario'))
+        db.session.add(UserNoteFavorites(user_id=reader_id, note_id=note.note_id))
+    db.session.commit()
+
+
+def _count_statements(client, url, headers):
+    # la primera peticion calienta caches (usuario actual, catalogo de tags, indice FTS)
+    assert client.get(url, headers=headers).status_code == 200
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(url, headers=headers)
+        response.get_data()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return len(statements), response
+
+
+@pytest.mark.parametrize('url', ENDPOINTS)
+def test_note_lists_do_not_grow_queries_with_notes(app, client, make_user, url):
+    author_id, _ = make_user('author')
+    reader_id, headers = make_user('reader')
+    voter_ids = [make_user(f'voter{index}')[0] for index in range(2)]
+    tag = Tags(name='deportes')
+    db.session.add(tag)
+    db.session.commit()
+
+    _add_notes(5, author_id, reader_id, voter_ids, tag)
+    few, response = _count_statements(client, url, headers)
+    assert response.get_data(as_text=True).count('"note_id"') >= 5
+
+    _add_notes(45, author_id, reader_id, voter_ids, tag)
+    many, response = _count_statements(client, url, headers)
+    assert response.get_data(as_text=True).count('"note_id"') >= 50
+    # los votos van como contadores; las filas de Votes no se cargan ni se mandan
+    assert '"vote_id"' not in response.get_data(as_text=True)
+
+    assert few == many
@@ -0,0 +1,46 @@
+"""
+Busqueda full-text en SQLite: la tabla FTS5 se crea una vez por proceso, pero
+solo cuenta como creada si la transaccion que la creo se confirma.
+"""
+from sqlalchemy import text
+from api import search
+from api.models import db, Notes
+
+
+def _fts_table_exists():
+    with db.engine.connect() as connection:
+        return connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notes_fts'")).first() is not None
+
+
+def test_rolled_back_index_creation_is_retried(client, make_user):
+    user_id, _ = make_user('author')
+    db.session.add(Notes(user_id=user_id, title='Borrador', content='...', is_anonymous=False))
+    db.session.flush()
+    db.session.rollback()
+    assert not search._sqlite_index_ready
+    assert not _fts_table_exists()
+
+    db.session.add(Notes(user_id=user_id, title='Receta de paella', content='Arroz', is_anonymous=False))
+    db.session.commit()
+    assert search._sqlite_index_ready
+
+    response = client.get('/api/notes/search?q=paella')
+    assert response.status_code == 200
+    assert [note['title'] for note in response.get_json()['notes']] == ['Receta de paella']
+
+
+def test_search_creates_the_index_in_its_own_transaction(client, make_user):
+    user_id, _ = make_user('author')
+    with db.engine.begin() as connection:
+        # insert sin ORM, como flask import-notes: no pasa por los eventos de Notes
+        connection.execute(text(
+            "INSERT INTO notes (user_id, title, content, is_anonymous, created_at, updated_at) "
+            "VALUES (:user_id, 'Receta de paella', 'Arroz', 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"),
+            {"user_id": user_id})
+
+    response = client.get('/api/notes/search?q=paella')
+    assert response.status_code == 200
+    assert len(response.get_json()['notes']) == 1
+    db.session.rollback()
+    assert search._sqlite_index_ready and _fts_table_exists()
@@ -0,0 +1,30 @@
+"""
+Manifiesto de dist/: solo lo que vite genera en assets/ (con hash en el nombre)
+se cachea como immutable; lo copiado de public/ se revalida aunque su nombre
+parezca llevar hash.
+"""
+import pytest
+from api.static_files import build_manifest
+
+FILES = {
+    'index.html': False,
+    'assets/index-3f9a1c2b.js': True,
+    'assets/logo-Ab_9-xYz.svg': True,
+    'assets/readme.txt': False,
+    'favicon-12345678.ico': False,
+    'img/banner-abcdefgh.png': False,
+}
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    for name in FILES:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'x')
+    return build_manifest(str(tmp_path))
+
+
+@pytest.mark.parametrize('name, immutable', FILES.items())
+def test_only_vite_assets_are_immutable(manifest, name, immutable):
+    assert manifest[name].immutable is immutable
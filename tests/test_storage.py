@@ -0,0 +1,45 @@
+"""
+flask gc-pictures (collect_garbage): borra lo que es del almacen por contenido
+y no se usa, pero nunca las fotos antiguas user_<id>_<fecha>.jpg que no estan
+en picture_blobs (algunas van en el repo).
+"""
+import datetime
+import os
+import time
+from api.images import remove_picture_files
+from api.models import db, PictureBlobs
+from api.storage import collect_garbage
+
+GRACE = 60
+KNOWN = 'a' * 64 + '.jpg'
+UNUSED = 'b' * 64 + '.jpg'
+ORPHAN = 'c' * 64 + '-large.webp'
+LEGACY = 'user_16_20250909_185726.jpg'
+
+
+def _touch(folder, name, age):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as picture:
+        picture.write(b'x')
+    old = time.time() - age
+    os.utime(path, (old, old))
+
+
+def test_collect_garbage_keeps_legacy_pictures(app, tmp_path):
+    old = datetime.datetime.utcnow() - datetime.timedelta(seconds=2 * GRACE)
+    db.session.add_all([PictureBlobs(filename=KNOWN, ref_count=1, ready=True, updated_at=old),
+                        PictureBlobs(filename=UNUSED, ref_count=0, ready=True, updated_at=old)])
+    db.session.commit()
+
+    for name in (KNOWN, 'a' * 64 + '-small.jpg', UNUSED, 'b' * 64 + '-small.webp',
+                 ORPHAN, LEGACY, 'tmpk2j4h1.upload', 'tmp9x8y7z.tmp'):
+        _touch(tmp_path, name, 2 * GRACE)
+    # reciente: puede estar a mitad de procesado
+    _touch(tmp_path, 'd' * 64 + '.png', 0)
+
+    removed, orphans = collect_garbage(str(tmp_path), GRACE, remove_picture_files)
+
+    assert (removed, orphans) == (1, 3)
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [KNOWN, 'a' * 64 + '-small.jpg', LEGACY, 'd' * 64 + '.png'])
+    assert db.session.get(PictureBlobs, UNUSED) is None
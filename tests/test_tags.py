@@ -0,0 +1,63 @@
+"""
+Catalogo de tags en memoria: busqueda de notas por prefijo de palabra del tag
+y /api/tags con el ETag del mismo snapshot que el cuerpo.
+"""
+import pytest
+from api.models import db, Notes, Tags
+from api.tags import tag_catalog
+
+NAMES = ['deportes', 'Salud mental', 'salud fisica', 'culinario', 'Deportes extremos']
+
+
+@pytest.fixture
+def tags(app):
+    tags = {name: Tags(name=name) for name in NAMES}
+    db.session.add_all(tags.values())
+    db.session.commit()
+    return {name: tag.tag_id for name, tag in tags.items()}
+
+
+@pytest.mark.parametrize('prefix, expected', [
+    ('dep', ['deportes', 'Deportes extremos']),
+    ('DEPORTES', ['deportes', 'Deportes extremos']),
+    ('salud', ['salud fisica', 'Salud mental']),
+    ('mental', ['Salud mental']),
+    ('salud m', ['Salud mental']),
+    ('porte', []),
+    ('z', []),
+])
+def test_matching_ids_by_word_prefix(tags, prefix, expected):
+    assert sorted(tag_catalog.matching_ids(prefix)) == sorted(tags[name] for name in expected)
+
+
+def test_search_by_tag(client, make_user, tags):
+    user_id, _ = make_user('author')
+    extreme, culinary = db.session.get(Tags, tags['Deportes extremos']), db.session.get(Tags, tags['culinario'])
+    sport = Notes(user_id=user_id, title='Correr', content='...', is_anonymous=False, tags=[extreme])
+    food = Notes(user_id=user_id, title='Cocinar', content='...', is_anonymous=False, tags=[culinary])
+    db.session.add_all([sport, food])
+    db.session.commit()
+
+    response = client.get('/api/notes/search?tag=extremo')
+    assert response.status_code == 200
+    assert [note['note_id'] for note in response.get_json()['notes']] == [sport.note_id]
+
+
+@pytest.mark.parametrize('query', ['', '?tag=', '?tag=%20%20'])
+def test_search_without_term_is_rejected(client, tags, query):
+    response = client.get(f'/api/notes/search{query}')
+    assert response.status_code == 400
+    assert 'msg' in response.get_json()
+
+
+def test_tags_etag_matches_body(client, tags):
+    response = client.get('/api/tags')
+    version, listing = tag_catalog.listing()
+    assert response.get_etag() == (version, False)
+    assert response.get_json() == listing
+
+    db.session.add(Tags(name='nuevo'))
+    db.session.commit()
+    changed = client.get('/api/tags', headers={"If-None-Match": f'"{version}"'})
+    assert changed.status_code == 200
+    assert changed.get_etag()[0] != version
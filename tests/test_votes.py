@@ -0,0 +1,176 @@
+"""
+Concurrencia de POST /api/vote: el upsert (INSERT ... ON CONFLICT) y el ajuste
+de positive_votes / negative_votes tienen que aguantar peticiones simultaneas
+del mismo usuario sobre la misma nota o comentario. En modo write-behind un voto
+sin volcar tambien tiene que cambiar los ETag de la nota.
+"""
+import random
+import threading
+from collections import Counter
+import pytest
+from sqlalchemy import func
+from api import routes
+from api.models import db, Notes, Comments, Votes
+from api.vote_buffer import VoteLog, VoteWriteBehind
+
+THREADS = 8
+VOTES_PER_THREAD = 25
+
+
+def _hammer(app, requests_by_thread):
+    # lanza cada lista de peticiones en su hilo, todos a la vez; devuelve los status
+    barrier = threading.Barrier(len(requests_by_thread))
+    statuses = Counter()
+    errors = []
+    lock = threading.Lock()
+
+    def worker(requests):
+        client = app.test_client()
+        barrier.wait()
+        for method, headers, body in requests:
+            try:
+                response = client.open('/api/vote', method=method, headers=headers, json=body)
+            except Exception as error:
+                errors.append(error)
+                continue
+            with lock:
+                statuses[response.status_code] += 1
+
+    threads = [threading.Thread(target=worker, args=(requests,)) for requests in requests_by_thread]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    return statuses
+
+
+def _assert_counters_match(model, target_column, target_id):
+    db.session.remove()
+    duplicated = db.session.execute(
+        db.select(Votes.user_id).where(target_column == target_id)
+        .group_by(Votes.user_id).having(func.count() > 1)).all()
+    assert duplicated == []
+
+    recount = Counter(db.session.execute(
+        db.select(Votes.vote_type).where(target_column == target_id)).scalars())
+    target = db.session.get(model, target_id)
+    assert (target.positive_votes, target.negative_votes) == (recount[1], recount[-1])
+    return recount
+
+
+def test_concurrent_upserts_keep_one_vote_per_user(app, make_user):
+    owner_id, _ = make_user('owner')
+    voters = [make_user(f'voter{index}') for index in range(3)]
+    note = Notes(user_id=owner_id, title='Nota', content='Contenido', is_anonymous=False)
+    db.session.add(note)
+    db.session.flush()
+    comment = Comments(note_id=note.note_id, user_id=owner_id, content='Comentario')
+    db.session.add(comment)
+    db.session.commit()
+    note_id, comment_id = note.note_id, comment.comment_id
+
+    # varios hilos por usuario: el mismo voto se da de alta y se invierte a la vez
+    requests_by_thread = []
+    for index in range(THREADS):
+        rng = random.Random(index)
+        _, headers = voters[index % len(voters)]
+        requests_by_thread.append([
+            ('POST', headers, {"note_id": note_id, "vote_type": rng.choice([1, -1])}
+             if rng.random() < 0.5 else {"comment_id": comment_id, "vote_type": rng.choice([1, -1])})
+            for _ in range(VOTES_PER_THREAD)])
+
+    statuses = _hammer(app, requests_by_thread)
+    # 201 alta, 200 cambio, 400 mismo voto repetido; nunca un 500
+    assert set(statuses) <= {200, 201, 400}
+    assert statuses[201] >= 1
+
+    note_votes = _assert_counters_match(Notes, Votes.note_id, note_id)
+    comment_votes = _assert_counters_match(Comments, Votes.comment_id, comment_id)
+    assert sum(note_votes.values()) == len(voters)
+    assert sum(comment_votes.values()) == len(voters)
+
+
+def test_concurrent_upserts_and_deletes_keep_counters(app, make_user):
+    owner_id, _ = make_user('owner')
+    voters = [make_user(f'voter{index}') for index in range(4)]
+    note = Notes(user_id=owner_id, title='Nota', content='Contenido', is_anonymous=False)
+    db.session.add(note)
+    db.session.commit()
+    note_id = note.note_id
+
+    requests_by_thread = []
+    for index in range(THREADS):
+        rng = random.Random(100 + index)
+        _, headers = voters[index % len(voters)]
+        requests_by_thread.append([
+            ('DELETE', headers, {"note_id": note_id}) if rng.random() < 0.25
+            else ('POST', headers, {"note_id": note_id, "vote_type": rng.choice([1, -1])})
+            for _ in range(VOTES_PER_THREAD)])
+
+    statuses = _hammer(app, requests_by_thread)
+    # 404 = DELETE sin voto
+    assert set(statuses) <= {200, 201, 400, 404}
+
+    _assert_counters_match(Notes, Votes.note_id, note_id)
+
+
+@pytest.fixture
+def write_behind(app, tmp_path, monkeypatch):
+    # vote_buffer en modo write-behind sin el hilo de volcado: los tests llaman a flush()
+    buffer = VoteWriteBehind()
+    buffer._app = app
+    buffer._log_dir = str(tmp_path)
+    buffer._fsync = False
+    buffer._log = VoteLog.create(str(tmp_path))
+    buffer.enabled = True
+    monkeypatch.setattr(routes, 'vote_buffer', buffer)
+    yield buffer
+    buffer.flush()
+    buffer._log.discard()
+
+
+@pytest.mark.parametrize('target', ['note', 'comment'])
+def test_unflushed_votes_change_the_etag(app, client, make_user, write_behind, target):
+    owner_id, _ = make_user('owner')
+    _, headers = make_user('voter')
+    note = Notes(user_id=owner_id, title='Nota', content='Contenido', is_anonymous=False)
+    db.session.add(note)
+    db.session.flush()
+    comment = Comments(note_id=note.note_id, user_id=owner_id, content='Comentario')
+    db.session.add(comment)
+    db.session.commit()
+    note_id, comment_id = note.note_id, comment.comment_id
+    urls = [f'/api/notes/{note_id}', f'/api/notes/{note_id}/comments', '/api/notes']
+
+    before = {url: client.get(url).get_etag()[0] for url in urls}
+    body = {"note_id": note_id} if target == 'note' else {"comment_id": comment_id}
+    assert client.post('/api/vote', headers=headers, json={**body, "vote_type": 1}).status_code == 201
+
+    # sin volcar: Notes.version no cambio, pero el ETag si
+    pending = {}
+    for url in urls:
+        response = client.get(url, headers={"If-None-Match": f'"{before[url]}"'})
+        assert response.status_code == 200
+        pending[url] = response.get_etag()[0]
+    if target == 'note':
+        assert client.get(f'/api/notes/{note_id}').get_json()['positive_votes'] == 1
+
+    write_behind.flush()
+    # las peticiones del test comparten la sesion del contexto de app: sin esto veria la nota de antes del volcado
+    db.session.remove()
+    for url in urls:
+        response = client.get(url, headers={"If-None-Match": f'"{pending[url]}"'})
+        assert response.status_code == 200
+        etag = response.get_etag()[0]
+        assert client.get(url, headers={"If-None-Match": f'"{etag}"'}).status_code == 304
+    if target == 'note':
+        assert client.get(f'/api/notes/{note_id}').get_json()['positive_votes'] == 1
+
+
+@pytest.mark.parametrize('query', ['note_id=abc', 'note_id=abc&comment_id=5', 'note_id=5&comment_id=1.5'])
+@pytest.mark.parametrize('url', ['/api/votes/count', '/api/votes/my-vote'])
+def test_vote_lookups_reject_non_numeric_ids(client, make_user, url, query):
+    _, headers = make_user('voter')
+    response = client.get(f'{url}?{query}', headers=headers)
+    assert response.status_code == 400